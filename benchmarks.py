@@ -0,0 +1,307 @@
+"""Benchmark suite for the library's hot paths, built on timing.AutoTimer
+
+Run the suite and save the results:
+    python benchmarks.py run -o current.json
+Compare against a stored baseline, exiting with status 1 on regressions:
+    python benchmarks.py compare baseline.json current.json
+"""
+from random import Random
+from timeit import default_repeat
+
+
+DEFAULT_SIZES = (100, 1000, 10000)
+
+
+def _words(rng, count, alphabet='abcd', shortest=3, longest=8):
+    return [''.join(rng.choice(alphabet)
+                    for _ in range(rng.randint(shortest, longest)))
+            for _ in range(count)]
+
+
+def bench_kmp(size):
+    """funcs.kmp scanning a text without a match"""
+    from funcs import kmp
+    rng = Random(size)
+    space = ''.join(rng.choice('ab') for _ in range(size))
+    term = 'abab' * 4 + 'c'
+    return lambda: kmp(term, space)
+
+
+def bench_kmp_mmap(size):
+    """funcs.kmp scanning a memory-mapped file of size bytes without a match
+
+    Run it on 1 GB with: python benchmarks.py run -k kmp_mmap -s 1000000000
+    """
+    from mmap import mmap, ACCESS_READ
+    from tempfile import TemporaryFile
+    from funcs import kmp
+    rng = Random(size)
+    block = rng.randbytes(min(size, 1 << 20))
+    with TemporaryFile() as file:
+        for _ in range(size // len(block)):
+            file.write(block)
+        file.write(block[:size % len(block)])
+        file.flush()
+        space = mmap(file.fileno(), 0, access=ACCESS_READ)
+    term = b'abab' * 4 + b'c'
+    def search():
+        return kmp(term, space)
+    search.close = space.close  # Unmapped by run() once timed
+    return search
+
+
+def bench_aho_search(size):
+    """funcs.AhoTrie.search over a text, with a 100-word dictionary"""
+    from funcs import AhoTrie
+    rng = Random(size)
+    trie = AhoTrie(*_words(rng, 100))
+    space = ''.join(rng.choice('abcd') for _ in range(size))
+    # Build the failure tree outside of the timed loop
+    next(trie.search(''), None)
+    return lambda: sum(1 for _ in trie.search(space))
+
+
+def bench_aho_dfa_search(size):
+    """funcs.AhoDFA.search over a text, with a 100-word dictionary"""
+    from funcs import AhoTrie
+    rng = Random(size)
+    dfa = AhoTrie(*_words(rng, 100)).compile()
+    space = ''.join(rng.choice('abcd') for _ in range(size))
+    return lambda: sum(1 for _ in dfa.search(space))
+
+
+def bench_aho_add_word(size):
+    """funcs.AhoTrie.add_word of a new word into a size-word dictionary, then
+    remove_word to restore it"""
+    from itertools import cycle
+    from funcs import AhoTrie
+    rng = Random(size)
+    dictionary = _words(rng, size, 'abcdefgh', 5, 12)
+    trie = AhoTrie(*dictionary)
+    # Sorted, as set order changes with the hash seed from run to run
+    words = cycle(sorted(set(_words(rng, 1000, 'abcdefgh', 8, 12))
+                         - set(dictionary)))
+    def add_remove():
+        word = next(words)
+        trie.add_word(word)
+        trie.remove_word(word)
+    return add_remove
+
+
+def bench_aho_rebuild(size):
+    """funcs.AhoTrie.add_words with a full failure tree rebuild, as a baseline
+    for aho_add_word"""
+    from funcs import AhoTrie
+    rng = Random(size)
+    trie = AhoTrie(*_words(rng, size, 'abcdefgh', 5, 12))
+    def add_rebuild():
+        trie.add_words('abcdefgh')
+        trie._build_fail_tree()  # pylint: disable=protected-access
+    return add_rebuild
+
+
+def bench_trie_build(size):
+    """funcs.Trie construction from size words"""
+    from funcs import Trie
+    words = _words(Random(size), size)
+    return lambda: Trie(words)
+
+
+def bench_trie_search(size):
+    """funcs.Trie.search_word for size words"""
+    from funcs import Trie
+    words = _words(Random(size), size)
+    trie = Trie(words[::2])
+    return lambda: [trie.search_word(word) for word in words]
+
+
+def bench_merge_sort(size):
+    """funcs.merge_sort on a copy of shuffled data"""
+    from funcs import merge_sort
+    data = list(range(size))
+    Random(size).shuffle(data)
+    return lambda: merge_sort(data[:])
+
+
+def bench_merge_sort_sp(size):
+    """funcs.merge_sort_sp on a copy of shuffled data"""
+    from funcs import merge_sort_sp
+    data = list(range(size))
+    Random(size).shuffle(data)
+    return lambda: merge_sort_sp(data[:])
+
+
+def bench_merge_sort_p(size):
+    """funcs.merge_sort_p on shuffled data"""
+    from funcs import merge_sort_p
+    data = list(range(size))
+    Random(size).shuffle(data)
+    return lambda: merge_sort_p(data)
+
+
+def bench_heap(size):
+    """listheap.Heap: push size items, then pop them all"""
+    from listheap import Heap
+    data = list(range(size))
+    Random(size).shuffle(data)
+    def push_pop():
+        heap = Heap()
+        for value in data:
+            heap.append(value)
+        while heap:
+            heap.pop()
+    return push_pop
+
+
+def bench_running_stats(size):
+    """running_stats.RunningStats.add for size samples"""
+    from running_stats import RunningStats
+    rng = Random(size)
+    data = [rng.randint(0, size // 4 + 1) for _ in range(size)]
+    def add_all():
+        stats = RunningStats()
+        for value in data:
+            stats.add(value)
+    return add_all
+
+
+# name -> (factory taking an input size and returning the callable to time,
+# input sizes).  If the callable has a close attribute, it's called once the
+# callable has been timed, to release what the factory set up.
+BENCHMARKS = {
+    'kmp': (bench_kmp, DEFAULT_SIZES + (100000,)),
+    'kmp_mmap': (bench_kmp_mmap, (10**6, 10**7)),
+    'aho_search': (bench_aho_search, DEFAULT_SIZES),
+    'aho_dfa_search': (bench_aho_dfa_search, DEFAULT_SIZES),
+    'aho_add_word': (bench_aho_add_word, DEFAULT_SIZES + (100000,)),
+    'aho_rebuild': (bench_aho_rebuild, DEFAULT_SIZES),
+    'trie_build': (bench_trie_build, DEFAULT_SIZES),
+    'trie_search': (bench_trie_search, DEFAULT_SIZES),
+    'merge_sort': (bench_merge_sort, DEFAULT_SIZES),
+    'merge_sort_sp': (bench_merge_sort_sp, DEFAULT_SIZES),
+    'merge_sort_p': (bench_merge_sort_p, DEFAULT_SIZES),
+    'heap': (bench_heap, (100, 1000)),
+    'running_stats': (bench_running_stats, (100, 1000)),
+}
+
+
+def run(names=None, sizes=None, repeat=default_repeat, callback=None,
+        reject_outliers=None, memory=False):
+    """Run benchmarks, returning a JSON-serialisable results dictionary
+
+    :param names: benchmark names to run (substring match).  Defaults to all
+    :param sizes: input sizes overriding each benchmark's own
+    :param repeat: number of timed repeats; each is autoranged to take at
+        least 0.2 seconds
+    :param callback: called with (key, result) after each benchmark
+    :param reject_outliers: Tukey fence multiplier for dropping outlying
+        repeats (see timing.TimingStats)
+    :param memory: also record per-loop peak memory, net allocated blocks
+        and GC collections (see timing.AutoTimer.memory)
+    """
+    from datetime import datetime, timezone
+    from platform import platform, python_version
+    from timing import AutoTimer, OutType
+    results = {}
+    for name, (factory, default_sizes) in BENCHMARKS.items():
+        if names and not any(i in name for i in names):
+            continue
+        for size in sizes or default_sizes:
+            bench = factory(size)
+            try:
+                stats = AutoTimer(bench).auto(
+                    repeat, outptype=OutType.STATS,
+                    reject_outliers=reject_outliers, memory=memory)
+            finally:
+                if hasattr(bench, 'close'):
+                    bench.close()
+            key = '{}[{}]'.format(name, size)
+            results[key] = dict(name=name, size=size, **stats.to_dict())
+            if callback:
+                callback(key, results[key])
+    return {'meta': {'python': python_version(), 'platform': platform(),
+                     'date': datetime.now(timezone.utc).isoformat()},
+            'results': results}
+
+
+def compare(baseline, current, alpha=0.05, threshold=0.02):
+    """Compare two results dictionaries from run()
+
+    Returns a list of (key, ratio, pvalue, regressed) for every benchmark in
+    both, where ratio is the current median over the baseline median.  A
+    benchmark has regressed if it is significantly slower (pvalue < alpha)
+    by more than threshold.
+    """
+    from statistics import median
+    from timing import permutation_pvalue
+    out = []
+    for key, curr in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        ratio = median(curr['timings']) / median(base['timings'])
+        pvalue = permutation_pvalue(base['timings'], curr['timings'])
+        out.append((key, ratio, pvalue,
+                    pvalue < alpha and ratio > 1 + threshold))
+    return out
+
+
+def main(argv=None):
+    from argparse import ArgumentParser
+    from json import dump, load
+    from statistics import median
+    from timing import format_time
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_cmd = commands.add_parser('run', help='run the benchmarks')
+    run_cmd.add_argument('-o', '--output', help='JSON file for the results')
+    run_cmd.add_argument('-k', '--filter', action='append',
+                         help='only run benchmarks whose name contains this')
+    run_cmd.add_argument('-s', '--size', type=int, action='append',
+                         help='input size to use instead of the defaults')
+    run_cmd.add_argument('-r', '--repeat', type=int, default=default_repeat)
+    run_cmd.add_argument('--reject-outliers', type=float, metavar='K',
+                         help='drop repeats beyond K IQRs of the quartiles')
+    run_cmd.add_argument('-m', '--memory', action='store_true',
+                         help='record memory use and GC runs per loop')
+    cmp_cmd = commands.add_parser('compare',
+                                  help='flag regressions against a baseline')
+    cmp_cmd.add_argument('baseline')
+    cmp_cmd.add_argument('current')
+    cmp_cmd.add_argument('--alpha', type=float, default=0.05,
+                         help='significance level (default 0.05)')
+    cmp_cmd.add_argument('--threshold', type=float, default=0.02,
+                         help='minimum slowdown to flag (default 0.02)')
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        def show(key, result):
+            print('{:<24} mean {} +/- {}, median {}, IQR {}'.format(
+                key, format_time(result['mean']),
+                format_time(result['ci'][1] - result['mean']),
+                format_time(result['median']), format_time(result['iqr'])))
+            if 'memory' in result:
+                print('{:<24} peak {} bytes, {:.4g} blocks, {:.4g} GC runs '
+                      'per loop'.format('', max(result['memory']['peak']),
+                                        median(result['memory']['blocks']),
+                                        median(result['memory']['gc'])))
+        results = run(args.filter, args.size, args.repeat, show,
+                      args.reject_outliers, args.memory)
+        if args.output:
+            with open(args.output, 'w') as file:
+                dump(results, file, indent=1)
+        return 0
+    with open(args.baseline) as file:
+        baseline = load(file)
+    with open(args.current) as file:
+        current = load(file)
+    regressed = False
+    for key, ratio, pvalue, flag in compare(baseline, current, args.alpha,
+                                            args.threshold):
+        regressed |= flag
+        print('{:<24} {:+7.1%}  p={:.3f}{}'.format(
+            key, ratio - 1, pvalue, '  REGRESSION' if flag else ''))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
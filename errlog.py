@@ -1,9 +1,23 @@
 """Better exception logging"""
+from collections import OrderedDict
 from functools import wraps
+from threading import Lock
 
-def print_exc(exc=None):
+# Default limits for the locals and globals shown by format_exc.  None means
+# unlimited.
+MAX_REPR = 240  # Characters in a single value's repr
+MAX_ITEMS = 40  # Names listed per frame, and items shown per container
+MAX_DEPTH = 3  # Nesting levels shown in container reprs
+GLOBALS_TTL = 60.0  # Seconds a module's cached global reprs stay valid
+GLOBALS_CACHE_SIZE = 32  # Modules (and limits) whose global reprs are cached
+
+_GLOBALS_CACHE = OrderedDict()
+_GLOBALS_CACHE_LOCK = Lock()
+
+
+def print_exc(exc=None, **kwargs):
     """Print an exception (print('\\n'.join(format_exc(exc))))"""
-    print('\n'.join(format_exc(exc)))
+    print('\n'.join(format_exc(exc, **kwargs)))
 #
 
 @wraps(print_exc)
@@ -11,19 +25,127 @@ def print_exception(*args, **kwargs):
     """alias for print_exc"""
     print_exc(*args, **kwargs)
 
-def format_exc(exc=None):
-    """Format an exception to be printed"""
+def make_repr(max_repr=MAX_REPR, max_items=MAX_ITEMS, max_depth=MAX_DEPTH):
+    """Return a size-bounded repr function"""
+    from reprlib import Repr
+    from sys import maxsize
+    length = maxsize if max_repr is None else max_repr
+    if max_repr is None and max_items is None and max_depth is None:
+        # reprlib is much slower than the builtin when nothing is trimmed
+        to_text = repr
+    else:
+        rep = Repr()
+        rep.maxlevel = maxsize if max_depth is None else max_depth
+        items = maxsize if max_items is None else max_items
+        for attr in ('maxtuple', 'maxlist', 'maxarray', 'maxdict', 'maxset',
+                     'maxfrozenset', 'maxdeque'):
+            setattr(rep, attr, items)
+        rep.maxstring = rep.maxlong = rep.maxother = length
+        to_text = rep.repr
+    def bounded_repr(obj):
+        try:
+            text = to_text(obj)
+        except Exception as exc: # pylint: disable=W0703
+            text = '<repr failed: {}>'.format(type(exc).__name__)
+        if len(text) > length:
+            text = text[:max(length-3, 0)] + '...'
+        return text
+    return bounded_repr
+#
+
+def _reprs(names, rep, max_items, cache=None):
+    """Yield (name, repr) for up to max_items names, computing reprs lazily"""
+    from itertools import islice
+    limit = len(names) if max_items is None else max_items
+    for name, value in islice(names, limit):
+        if cache is None:
+            text = rep(value)
+        else:
+            hit = cache.get(name)
+            if hit is not None and hit[0] == id(value):
+                text = hit[1]
+            else:
+                text = rep(value)
+                cache[name] = (id(value), text)
+        yield str(name), text
+#
+
+def _format_names(names, rep, max_items, cache=None):
+    """Yield '    name = repr' lines, computing each repr only when yielded"""
+    yield from ('    {} = {}'.format(name, text)
+                for name, text in _reprs(names, rep, max_items, cache))
+    if max_items is not None and len(names) > max_items:
+        yield '    ... {} more'.format(len(names) - max_items)
+#
+
+def _globals_cache(globals_, key, ttl):
+    """Return the cached global reprs of a module, resetting stale ones
+
+    The least recently used entries are dropped past GLOBALS_CACHE_SIZE.  The
+    module name is part of the key, so a namespace reusing the id of a freed
+    one only shares its entry if it has the same name too.
+    """
+    from time import monotonic
+    now = monotonic()
+    key = (globals_.get('__name__'), id(globals_)) + key
+    with _GLOBALS_CACHE_LOCK:
+        entry = _GLOBALS_CACHE.get(key)
+        if entry is None or ttl is None or now - entry[0] > ttl:
+            entry = _GLOBALS_CACHE[key] = (now, {})
+        _GLOBALS_CACHE.move_to_end(key)
+        while len(_GLOBALS_CACHE) > GLOBALS_CACHE_SIZE:
+            _GLOBALS_CACHE.popitem(last=False)
+    return entry[1]
+#
+
+def _format(tbe, globals_lines, locals_lines):
+    """Yield the lines of an exception from its parts
+
+    globals_lines yields the global name lines; locals_lines yields an
+    iterable of local name lines for each frame in tbe.stack.
+    """
+    from traceback import StackSummary
+    if tbe.stack:
+        yield 'Traceback (most recent call last):'
+        yield '  Globals:'
+        yield from globals_lines
+        for summary, lines in zip(tbe.stack, locals_lines):
+            for lin in StackSummary.from_list([summary]).format():
+                yield from (i for i in lin.split('\n') if i != '')
+            yield from lines
+    yield from (i for lin in tbe.format_exception_only()
+                for i in lin.split('\n') if i != '')
+#
+
+def format_exc(exc=None, *, max_repr=MAX_REPR, max_items=MAX_ITEMS,
+               max_depth=MAX_DEPTH, globals_ttl=GLOBALS_TTL):
+    """Format an exception to be printed
+
+    Each frame is followed by its locals, and the outermost frame's module
+    globals are listed up front.  Values are shown with a repr bounded by
+    max_repr characters, max_items items per container and max_depth levels
+    of nesting, and at most max_items names are listed per frame.  Reprs are
+    only computed for lines as they are yielded.  Global reprs are cached per
+    module for globals_ttl seconds, and reused while a name still refers to
+    the same object.
+    """
     from sys import exc_info
-    from traceback import TracebackException
-    from itertools import chain
+    from traceback import TracebackException, walk_tb
     if exc is None:
         exc = exc_info()
-    tbe = TracebackException(*exc, limit=None, capture_locals=True)
-    itr = chain.from_iterable(lin.split('\n') for lin in tbe.format(chain=None))
-    title = (next(itr), '  Globals:') # pylint: disable=R1708
-    globals_ = exc[2].tb_frame.f_globals
-    globals_ = ('    {} = {}'.format(k, v) for k, v in globals_.items())
-    yield from chain(title, globals_, (i for i in itr if i != ''))
+    tbe = TracebackException(*exc, limit=None)
+    rep = make_repr(max_repr, max_items, max_depth)
+    def globals_lines():
+        globals_ = exc[2].tb_frame.f_globals
+        cache = _globals_cache(globals_, (max_repr, max_items, max_depth),
+                               globals_ttl)
+        yield from _format_names(list(globals_.items()), rep, max_items, cache)
+    # tbe.stack holds the frame summaries (with column positions for the
+    # carets); walk_tb gives the matching frames, whose locals are read live
+    locals_lines = (_format_names(sorted(frame.f_locals.items()), rep,
+                                  max_items)
+                    for frame, _ in walk_tb(exc[2]))
+    yield from _format(tbe, globals_lines(), locals_lines)
 #
 
 @wraps(format_exc)
@@ -31,10 +153,419 @@ def format_exception(*args, **kwargs):
     """alias for format_exc"""
     format_exc(*args, **kwargs)
 
+def fingerprint(exc=None):
+    """Return a hashable fingerprint of an exception, without formatting it
+
+    The fingerprint is the exception type plus the code object and line of
+    every frame in the traceback.
+    """
+    from sys import exc_info
+    from traceback import walk_tb
+    if exc is None:
+        exc = exc_info()
+    return (exc[0],) + tuple((frame.f_code, lineno)
+                             for frame, lineno in walk_tb(exc[2]))
+#
+
+class ExcAggregator:
+    """Deduplicating, rate-limited exception logger
+
+    report() fingerprints each exception.  The first occurrence of a
+    fingerprint is formatted in full with format_exc; repeats only cost a
+    fingerprint and a counter update.  Each fingerprint has a token bucket
+    (rate tokens per second, up to burst): a repeat that finds a token is
+    logged as its one-line exception message, the rest are counted and
+    written as a summary every interval seconds, by the next report or else
+    by a daemon thread, and when the interpreter exits or on close().  At most
+    max_fingerprints are tracked; the least recently seen is summarised and
+    forgotten when the limit is reached.  Extra keyword arguments go to
+    format_exc.
+    """
+    def __init__(self, file=None, interval=10.0, rate=1/60, burst=1,
+                 max_fingerprints=1024, clock=None, **format_kwargs):
+        from atexit import register
+        from threading import Event, Thread
+        from time import monotonic
+        self.file = file
+        self.interval = interval
+        self.rate = rate
+        self.burst = burst
+        self.max_fingerprints = max_fingerprints
+        self.format_kwargs = format_kwargs
+        self._clock = clock or monotonic
+        self._lock = Lock()
+        # fingerprint -> [total, suppressed, tokens, last refill time]
+        self._seen = OrderedDict()
+        self._last_flush = self._clock()
+        self._closed = Event()
+        self._thread = None
+        if interval and interval > 0:
+            self._thread = Thread(target=self._run, name='excaggregator',
+                                  daemon=True)
+            self._thread.start()
+        register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        # Write the summaries of a storm that has stopped, which no later
+        # report would
+        while not self._closed.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    def _write(self, lines):
+        from sys import stdout
+        if lines:
+            (self.file or stdout).write('\n'.join(lines) + '\n')
+
+    @staticmethod
+    def _label(key, count, total):
+        # One line naming a fingerprint by its type and innermost frame
+        exc_type, frames = key[0], key[1:]
+        where = ''
+        if frames:
+            code, lineno = frames[-1]
+            where = ' at {}:{} in {}'.format(code.co_filename, lineno,
+                                             code.co_name)
+        return '{} suppressed {} time{} ({} total){}'.format(
+            getattr(exc_type, '__qualname__', exc_type), count,
+            's' if count != 1 else '', total, where)
+
+    def report(self, exc=None):
+        """Log an exception, returning True if it was written in full"""
+        from sys import exc_info
+        from traceback import format_exception_only
+        if exc is None:
+            exc = exc_info()
+        key = fingerprint(exc)
+        now = self._clock()
+        lines = []
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None:
+                if len(self._seen) >= self.max_fingerprints:
+                    old_key, old = self._seen.popitem(last=False)
+                    if old[1]:
+                        lines.append(self._label(old_key, old[1], old[0]))
+                entry = self._seen[key] = [1, 0, self.burst - 1, now]
+                full = True
+            else:
+                self._seen.move_to_end(key)
+                entry[0] += 1
+                entry[2] = min(self.burst,
+                               entry[2] + (now - entry[3]) * self.rate)
+                entry[3] = now
+                full = False
+                if entry[2] >= 1:
+                    entry[2] -= 1
+                    lines.extend(i.rstrip('\n') for i in
+                                 format_exception_only(*exc[:2]))
+                else:
+                    entry[1] += 1
+            if now - self._last_flush >= self.interval:
+                lines.extend(self._summaries(now))
+        if full:
+            lines[:0] = format_exc(exc, **self.format_kwargs)
+        self._write(lines)
+        return full
+
+    def _summaries(self, now):
+        # Collect and reset pending counts; the caller must hold the lock
+        self._last_flush = now
+        lines = []
+        for key, entry in self._seen.items():
+            if entry[1]:
+                lines.append(self._label(key, entry[1], entry[0]))
+                entry[1] = 0
+        return lines
+
+    def flush(self):
+        """Write a summary of every suppressed repeat now"""
+        with self._lock:
+            lines = self._summaries(self._clock())
+        self._write(lines)
+
+    def close(self):
+        """Stop the flushing thread and write the pending summaries"""
+        from atexit import unregister
+        unregister(self.close)
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+#
+
+def capture_exc(exc=None, *, max_repr=MAX_REPR, max_items=MAX_ITEMS,
+                max_depth=MAX_DEPTH, globals_ttl=GLOBALS_TTL):
+    """Capture the state needed to format an exception later
+
+    Returns (tbe, globals_lines, locals_lines) for format_captured: the frame
+    summaries, without their source lines (which are read when formatting),
+    and the bounded reprs of the globals and of each frame's locals, taken now
+    so the values can't change before the exception is formatted.
+    """
+    from sys import exc_info
+    from traceback import TracebackException, walk_tb
+    if exc is None:
+        exc = exc_info()
+    tbe = TracebackException(*exc, limit=None, lookup_lines=False)
+    if exc[2] is None:
+        return tbe, [], []
+    rep = make_repr(max_repr, max_items, max_depth)
+    globals_ = exc[2].tb_frame.f_globals
+    cache = _globals_cache(globals_, (max_repr, max_items, max_depth),
+                           globals_ttl)
+    globals_lines = list(_format_names(list(globals_.items()), rep, max_items,
+                                       cache))
+    locals_lines = [list(_format_names(sorted(frame.f_locals.items()), rep,
+                                       max_items))
+                    for frame, _ in walk_tb(exc[2])]
+    return tbe, globals_lines, locals_lines
+#
+
+def format_captured(captured):
+    """Format the output of capture_exc, like format_exc"""
+    yield from _format(*captured)
+#
+
+def _json_tokens(exc, rep, max_items, cache):
+    """Yield (piece, closer) tokens of the JSON for an exception
+
+    closer is the text that closes a container opened by piece, None for a
+    plain item, or _CLOSE for a piece that closes the innermost container.
+    """
+    from json import dumps
+    from traceback import extract_tb, walk_tb
+    def names_object(key, names, cache=None):
+        yield ',"{}":{{'.format(key), '}'
+        for ind, (name, text) in enumerate(_reprs(names, rep, max_items,
+                                                  cache)):
+            yield '{}{}:{}'.format(',' if ind else '', dumps(name),
+                                   dumps(text)), None
+        yield '}', _CLOSE
+        omitted = 0 if max_items is None else max(len(names) - max_items, 0)
+        yield ',"{}_omitted":{}'.format(key, omitted), None
+    if exc[2] is not None:
+        yield from names_object('globals',
+                                list(exc[2].tb_frame.f_globals.items()), cache)
+    yield ',"frames":[', ']'
+    frames = [frame for frame, _ in walk_tb(exc[2])]
+    for ind, (summary, frame) in enumerate(zip(extract_tb(exc[2]), frames)):
+        yield '{}{{"file":{},"line":{},"name":{},"code":{}'.format(
+            ',' if ind else '', dumps(summary.filename), summary.lineno,
+            dumps(summary.name), dumps(summary.line)), '}'
+        yield from names_object('locals', sorted(frame.f_locals.items()))
+        yield '}', _CLOSE
+    yield ']', _CLOSE
+#
+
+_CLOSE = object()
+
+def iter_json(exc=None, *, max_bytes=None, max_repr=MAX_REPR,
+              max_items=MAX_ITEMS, max_depth=MAX_DEPTH,
+              globals_ttl=GLOBALS_TTL):
+    """Yield the pieces of one JSON object describing an exception
+
+    The object holds the exception type and message, the outermost frame's
+    globals and a list of frames, each with its locals, as name -> repr
+    objects bounded as in format_exc.  Reprs are computed as pieces are
+    yielded.  If max_bytes is given, the object stops growing before it would
+    exceed it: the message is cut short, open containers are closed and
+    "truncated" is set to true.  The type and the flag are always written, so
+    a cap smaller than those is exceeded.
+    """
+    from json import dumps
+    from sys import exc_info
+    from traceback import format_exception_only
+    if exc is None:
+        exc = exc_info()
+    rep = make_repr(max_repr, max_items, max_depth)
+    message = ''.join(format_exception_only(*exc[:2])).strip()
+    tail = ',"truncated":{}}}'
+    head = '{{"type":{},"message":'.format(
+        dumps(getattr(exc[0], '__qualname__', str(exc[0]))))
+    size = len(head) + len(tail.format('false'))
+    cut = False
+    if max_bytes is not None:
+        # The message gets at most half the cap, and no more than the type and
+        # flag leave.  Escapes take several characters each, so scale it down
+        # until it fits
+        room = max(min(max_bytes // 2, max_bytes - size - 2), 0)
+        while len(dumps(message)) - 2 > room:
+            cut = True
+            escaped = len(dumps(message)) - 2
+            message = message[:len(message) * room // escaped]
+    message = dumps(message)
+    yield head + message
+    size += len(message)
+    cache = None
+    if exc[2] is not None:
+        cache = _globals_cache(exc[2].tb_frame.f_globals,
+                               (max_repr, max_items, max_depth), globals_ttl)
+    stack = []
+    for piece, closer in _json_tokens(exc, rep, max_items, cache):
+        if closer is _CLOSE:
+            stack.pop()
+            yield piece
+            continue
+        need = len(piece) + len(closer or '')
+        if max_bytes is not None and size + need > max_bytes:
+            yield ''.join(reversed(stack)) + tail.format('true')
+            return
+        size += need
+        if closer:
+            stack.append(closer)
+        yield piece
+    yield tail.format('true' if cut else 'false')
+#
+
+def write_json(exc=None, file=None, *, buffer_size=1 << 16, **kwargs):
+    """Write an exception to file as one line of JSON (see iter_json)
+
+    Pieces are collected and written in chunks of about buffer_size
+    characters.  Returns the number of characters written.
+    """
+    from sys import stdout, exc_info
+    if exc is None:
+        exc = exc_info()
+    file = file or stdout
+    parts = []
+    pending = written = 0
+    for piece in iter_json(exc, **kwargs):
+        parts.append(piece)
+        pending += len(piece)
+        if pending >= buffer_size:
+            file.write(''.join(parts))
+            written += pending
+            parts, pending = [], 0
+    parts.append('\n')
+    file.write(''.join(parts))
+    return written + pending + 1
+#
+
+class BackgroundLogger:
+    """Log exceptions from a worker thread
+
+    log() only captures the exception (see capture_exc) on the calling
+    thread and puts it on a bounded queue; a daemon thread formats and writes
+    it.  When the queue is full the report is dropped and counted in
+    dropped, and a note of how many were dropped is written with the next
+    report.  Reports that fail to format or write are counted in errors.
+    Queued reports are written when the interpreter exits, or on
+    flush()/close().  Extra keyword arguments go to capture_exc.
+    """
+    def __init__(self, file=None, maxsize=1000, **capture_kwargs):
+        from atexit import register
+        from queue import Queue
+        from threading import Thread
+        self.file = file
+        self.capture_kwargs = capture_kwargs
+        self.logged = 0
+        self.dropped = 0
+        self.errors = 0
+        self._noted = 0
+        self._queue = Queue(maxsize)
+        self._thread = Thread(target=self._run, name='errlog', daemon=True)
+        self._thread.start()
+        register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def log(self, exc=None):
+        """Queue an exception for logging, returning False if it was dropped"""
+        from queue import Full
+        from sys import exc_info
+        if exc is None:
+            exc = exc_info()
+        try:
+            self._queue.put_nowait(capture_exc(exc, **self.capture_kwargs))
+        except Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        from sys import stdout
+        while True:
+            captured = self._queue.get()
+            try:
+                if captured is None:
+                    return
+                file = self.file or stdout
+                dropped = self.dropped
+                if dropped != self._noted:
+                    file.write('{} exception report{} dropped (queue '
+                               'full)\n'.format(dropped - self._noted,
+                                                's' if dropped - self._noted != 1
+                                                else ''))
+                    self._noted = dropped
+                file.write('\n'.join(format_captured(captured)) + '\n')
+                self.logged += 1
+                if self._queue.empty():
+                    file.flush()
+            except Exception:  # pylint: disable=broad-except
+                # A report that can't be formatted or written mustn't stop
+                # the worker, or every later one would be dropped
+                self.errors += 1
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until every queued exception has been written"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Write every queued exception and stop the worker thread"""
+        from atexit import unregister
+        unregister(self.close)
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+#
+
 def _test():
     default_tb()
     custom_tb()
 #
+def _benchmark(number=5, size=200000):
+    """Time format_exc against traceback with a large module-level cache"""
+    from sys import exc_info
+    from timeit import timeit
+    from traceback import format_exception as tb_format_exception
+    # The exception is caught in a function whose module globals hold the
+    # cache, as format_exc lists the globals of the catching frame
+    namespace = {'CACHE': {i: 'value {}'.format(i) for i in range(size)}}
+    exec('def fail(seq):\n' # pylint: disable=W0122
+         '    local = list(seq)\n'
+         '    return local[0] / 0\n'
+         'def catch(seq):\n'
+         '    try:\n'
+         '        fail(seq)\n'
+         '    except ZeroDivisionError:\n'
+         '        return exc_info()\n', namespace)
+    namespace['exc_info'] = exc_info
+    exc = namespace['catch'](range(size))
+    unbounded = {'max_repr': None, 'max_items': None, 'max_depth': None}
+    tests = (('traceback.format_exception', lambda: tb_format_exception(*exc)),
+             ('format_exc', lambda: list(format_exc(exc))),
+             ('format_exc, unbounded', lambda: list(format_exc(exc, **unbounded))))
+    for name, func in tests:
+        print('{:<28} {:10.6f} sec per call, {} characters'.format(
+            name, timeit(func, number=number) / number,
+            sum(len(i) for i in func())))
+#
 def tst(seq):
     """Test function which may error"""
     out = []
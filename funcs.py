@@ -1,6 +1,6 @@
 """Simply a library of random useful functions."""
 from __future__ import generator_stop
-from functools import wraps
+from functools import lru_cache, wraps
 
 
 def menu(collection, title, prompt, *, rows=None, cols=None, min_len=38):
@@ -314,6 +314,11 @@ def kmp(term, space, table=None):
     # Convert the inputs into lists so they can be indexed into (in case they're
     # iterable but not indexable)
     term = list(term)
+    # Buffers (bytes, bytearray, mmap, memoryview...) are searched in place
+    bterm = _buffer_term(term, space)
+    if bterm is not None:
+        return next(_buffer_finditer(bterm, space), -1) != -1
+    # 
     space = list(space)
     # Compute the lengths of the inputs to minimize the overhead from bunches of
     # calls to len
@@ -360,10 +365,343 @@ def kmp(term, space, table=None):
 # 
 
 
+KMP_BUFFER_BLOCK = 1 << 20
+
+
+def _buffer_term(term, space):
+    """Return term as bytes if space is a buffer of bytes, else None.
+
+    Only buffers with one-byte items (formats B, b and c) are searched as raw
+    bytes; anything else (array('i'), say) is searched item by item.
+    """
+    if isinstance(space, str):
+        return None
+    # 
+    try:
+        with memoryview(space) as view:
+            fmt, itemsize = view.format, view.itemsize
+        # 
+        term = bytes(term)
+    except (TypeError, ValueError):  # Not a buffer, or term isn't bytes-like
+        return None
+    # 
+    if itemsize != 1 or fmt.lstrip('@=<>!') not in ('B', 'b', 'c'):
+        return None
+    # 
+    # Signed bytes only compare equal to their raw values up to 127
+    if fmt.lstrip('@=<>!') == 'b' and any(char > 127 for char in term):
+        return None
+    # 
+    return term
+
+
+def _buffer_finditer(term, space, block=KMP_BUFFER_BLOCK):
+    """Yield the byte offset of every match of term (bytes) within a buffer.
+
+    The buffer's own find is used where it has one (bytes, bytearray and mmap),
+    which searches in C without copying anything.  Other byte buffers (memoryviews,
+    array('B')...) are copied and searched a block at a time, with adjacent blocks
+    overlapping by len(term) - 1 bytes so no match is missed.
+    """
+    find = getattr(space, 'find', None)
+    if find is not None:
+        pos = find(term)
+        while pos != -1:
+            yield pos
+            pos = find(term, pos + 1)
+        # 
+        return
+    # 
+    with memoryview(space) as view:
+        view = view.cast('B') if view.c_contiguous else memoryview(view.tobytes())
+        overlap = max(len(term) - 1, 0)
+        for start in range(0, max(len(view), 1), block):
+            # A match starting in the overlap would start at or after the next
+            # block, so it's only found in that block
+            chunk = bytes(view[start:start + block + overlap])
+            pos = chunk.find(term)
+            while pos != -1:
+                yield start + pos
+                pos = chunk.find(term, pos + 1)
+            # 
+        # 
+    # 
+
+
+class KMPMatcher:
+    """Stateful KMP search over a stream of chunks.
+
+    Each call to feed() continues from where the last one stopped, so matches
+    spanning chunk boundaries are found.  Offsets are global: they count every
+    item fed since creation (or the last reset).  Only the search term and its
+    prefix table are kept, so memory use is O(len(term)).  An empty term
+    matches at every offset, as in kmp_finditer.
+    A prefix table from kmp_prefix(term, len(term)) can be provided but is not
+    necessary.
+    """
+    def __init__(self, term, table=None):
+        self.term = list(term)
+        # The table needs an entry for the full term, so that after a match the
+        # search can carry on from the longest suffix of it that's also a prefix
+        # (which finds overlapping matches)
+        if not table or len(table) <= len(self.term):
+            table = kmp_prefix(self.term, len(self.term))
+        # 
+        self.table = table
+        self.reset()
+
+    def __repr__(self):
+        return 'KMPMatcher({!r})'.format(self.term)
+
+    def reset(self):
+        """Forget any partial match and restart the offsets at 0."""
+        self.pos = 0  # Number of items seen so far
+        self.ref = 0  # Number of items of the term currently matched
+
+    def feed(self, chunk):
+        """Return the start offsets of the matches ending within chunk."""
+        return list(self._scan(chunk))
+
+    def _scan(self, space):
+        """Yield match start offsets lazily, updating the state as it goes."""
+        term, table = self.term, self.table
+        termlen = len(term)
+        pos, ref = self.pos, self.ref
+        if not termlen:
+            return (yield from self._scan_empty(space))
+        # 
+        try:
+            for char in space:
+                # Count the character first, so the state is consistent whenever
+                # a match is yielded (the consumer may stop there)
+                pos += 1
+                # Drop the reference back until the character can extend it (or
+                # it's back at the start of the term)
+                while ref and char != term[ref]:
+                    ref = table[ref]
+                # 
+                if char == term[ref]:
+                    ref += 1
+                    if ref == termlen:  # A match ends on this character
+                        ref = table[ref]
+                        yield pos - termlen
+                    # 
+                # 
+            # 
+        finally:
+            self.pos, self.ref = pos, ref
+        # 
+
+    def _scan_empty(self, space):
+        """Yield every offset, for an empty term.  ref is set once the match
+        at offset 0 has been yielded, so it's only yielded once."""
+        if not self.ref:
+            self.ref = 1
+            yield 0
+        # 
+        for _ in space:
+            self.pos += 1
+            yield self.pos
+        # 
+
+
+def _empty_finditer(space):
+    """Yield every offset within space, and the one just past its end."""
+    yield 0
+    for pos, _ in enumerate(space, 1):
+        yield pos
+    # 
+
+
+def kmp_finditer(term, space, table=None):
+    """Yield the start offset of every match of term within space.
+
+    Overlapping matches are included.  space can be any iterable, including an
+    unbounded iterator; it's consumed lazily, one item at a time, so memory use
+    is O(len(term)).  To search a file, pass chain.from_iterable(file) (offsets
+    are then in characters, or bytes for a binary file), or feed its chunks to a
+    KMPMatcher.  Buffers such as bytes and mmaps are searched in place instead.
+    An empty term matches at every offset, from 0 to the end of space
+    inclusive, as with re.finditer (and as kmp finds it in any space).
+    A prefix table from kmp_prefix(term, len(term)) can be provided but is not
+    necessary.
+    """
+    term = list(term)
+    if not term:
+        return _empty_finditer(space)
+    # 
+    bterm = _buffer_term(term, space)
+    if bterm is not None:
+        return _buffer_finditer(bterm, space)
+    # 
+    return KMPMatcher(term, table)._scan(space)
+# 
+
+
+KMP_CACHE_SIZE = 4096
+
+
+class KMPPattern:
+    """A compiled KMP search term; see compile_kmp.
+
+    As well as the prefix table, this holds the search term's DFA: one dict per
+    state, mapping each item of the term to the next state (anything else goes
+    back to state 0).  Following it takes a single lookup per item searched,
+    where the prefix table may need several.  Offsets are those of the start of
+    each match, and overlapping matches are included.  An empty term matches
+    at every offset, as in kmp_finditer.
+    """
+    def __init__(self, term):
+        self.term = term
+        termlen = len(term)
+        self.table = table = kmp_prefix(term, termlen)
+        alphabet = set(term)
+        dfa = []
+        for state in range(termlen + 1):
+            # A mismatch behaves as it would in the longest proper border of the
+            # matched part; state 0 has no border, so it just stays put
+            trans = dict(dfa[table[state]]) if state else {}
+            if state < termlen:
+                trans[term[state]] = state + 1
+            # Keep only the transitions that go somewhere
+            dfa.append({char: trans[char] for char in alphabet
+                        if trans.get(char)})
+        # 
+        self.dfa = dfa
+        # The term as bytes, for searching buffers in place
+        self.bterm = _buffer_term(term, b'')
+
+    def __repr__(self):
+        return 'compile_kmp({!r})'.format(self.term)
+
+    def search(self, space):
+        """Return the offset of the first match within space, or -1."""
+        for pos in self.finditer(space):
+            return pos
+        # 
+        return -1
+
+    def finditer(self, space):
+        """Yield the offset of every match within space (any iterable)."""
+        if not self.term:
+            return _empty_finditer(space)
+        # 
+        if (self.bterm is not None
+                and _buffer_term(self.bterm, space) is not None):
+            return _buffer_finditer(self.bterm, space)
+        # 
+        return self._finditer(space)
+
+    def _finditer(self, space):
+        dfa = self.dfa
+        termlen = len(self.term)
+        state = 0
+        for pos, char in enumerate(space, 1):
+            state = dfa[state].get(char, 0)
+            if state == termlen:
+                yield pos - termlen
+            # 
+        # 
+
+    def count(self, space):
+        """Return the number of matches within space (any iterable)."""
+        if not self.term:
+            return sum(1 for _ in _empty_finditer(space))
+        # 
+        if (self.bterm is not None
+                and _buffer_term(self.bterm, space) is not None):
+            return sum(1 for _ in _buffer_finditer(self.bterm, space))
+        # 
+        dfa = self.dfa
+        termlen = len(self.term)
+        state = found = 0
+        for char in space:
+            state = dfa[state].get(char, 0)
+            if state == termlen:
+                found += 1
+            # 
+        # 
+        return found
+
+    def matcher(self):
+        """Return a KMPMatcher for this term, sharing its prefix table."""
+        return KMPMatcher(self.term, self.table)
+
+
+def compile_kmp(term):
+    """Return a KMPPattern for a search term, much like re.compile.
+
+    The most recently used KMP_CACHE_SIZE patterns are cached, keyed on the
+    term, so compiling the same term repeatedly is cheap.  Terms that aren't
+    strings or bytes are converted to tuples.
+    """
+    if not isinstance(term, (str, bytes)):
+        term = tuple(term)
+    # 
+    return _compile_kmp(term)
+
+
+@lru_cache(maxsize=KMP_CACHE_SIZE)
+def _compile_kmp(term):
+    return KMPPattern(term)
+# 
+
+
+# The pattern a worker of kmp_batch searches for, set by _kmp_batch_init
+_KMP_BATCH_PATTERN = None
+
+
+def _kmp_batch_init(term):
+    """Compile the search term once per worker process."""
+    global _KMP_BATCH_PATTERN  # pylint: disable=global-statement
+    _KMP_BATCH_PATTERN = compile_kmp(term)
+
+
+def _kmp_batch_chunk(chunk, pattern=None):
+    """Search one chunk of (index, text) pairs with pattern, by default the
+    worker's."""
+    finditer = (pattern or _KMP_BATCH_PATTERN).finditer
+    return [(ind, list(finditer(text))) for ind, text in chunk]
+
+
+def kmp_batch(term, texts, processes=None, chunksize=1000, ordered=True):
+    """Yield (index, match offsets) for each of many texts, on a process pool.
+
+    The term is compiled once per worker (see compile_kmp), and the texts are
+    sent to the workers chunksize at a time, so per-text overhead is only the
+    search itself.  index is the position of the text within texts; results
+    come back in that order if ordered is set, otherwise as soon as each chunk
+    is done.  texts is read ahead of the results, as multiprocessing does.
+    With processes=1 the texts are searched in this process, without a pool.
+    processes defaults to os.cpu_count().
+    """
+    from itertools import islice
+    term = compile_kmp(term).term  # Fail early, and only convert the term once
+    items = enumerate(texts)
+    chunks = iter(lambda: list(islice(items, chunksize)), [])
+    if processes == 1:
+        pattern = compile_kmp(term)
+        for chunk in chunks:
+            yield from _kmp_batch_chunk(chunk, pattern)
+        # 
+        return
+    # 
+    from multiprocessing import Pool
+    with Pool(processes, _kmp_batch_init, (term,)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for found in imap(_kmp_batch_chunk, chunks):
+            yield from found
+        # 
+    # 
+
+
 class AhoTrie:
     """docstring"""
     class Node:
         """docstring"""
+        __slots__ = ('state', 'key', 'fail', 'children', 'word', 'out',
+                     'fail_children', 'depth')
+
         def __init__(self, state, key,
                      childrenword=(None, ''), fail=None):
             """docstring"""
@@ -371,15 +709,23 @@ class AhoTrie:
             self.state = state
             self.key = key
             self.fail = fail
-            # Define children and words as empty and then override them because
-            # if they're defined as empty structures in the default arguments,
-            # then all instances of the class will use the same mutable object
-            # rather than each instance having it's own
+            # Define children as empty and then override it because if it's
+            # defined as an empty structure in the default arguments, then all
+            # instances of the class will use the same mutable object rather
+            # than each instance having it's own
             self.children = {}
-            self.words = []
             self.word = word
+            # The nearest node on the failure chain with a word (the dictionary
+            # suffix link), so the words ending here can be found without
+            # copying them into every node
+            self.out = None
             if children:
                 self.children = children
+            # Nodes whose failure point this is, and the length of the prefix
+            # this node represents (so of its word, if it has one).  The first
+            # is kept to update the failure tree in place when words are added
+            self.fail_children = ()  # Made a set when the first is added
+            self.depth = 0
 
         def __repr__(self):
             """docstring"""
@@ -403,10 +749,18 @@ class AhoTrie:
             """docstring"""
             return char in self.children
 
+        def add_fail_child(self, node):
+            """docstring"""
+            if self.fail_children:
+                self.fail_children.add(node)
+            else:
+                self.fail_children = {node}
+
         def add_child(self, state, key):
             """docstring"""
             if key not in self.children:
                 self.children[key] = AhoTrie.Node(state, key)
+                self.children[key].depth = self.depth + 1
             return self.children[key]
 
         def build_str(self,
@@ -446,7 +800,8 @@ class AhoTrie:
             self.key = ''
             self.state = -1
             self.child = AhoTrie.Node(0, 'root', fail=self)
-            self.words = []
+            self.word = ''
+            self.out = None
 
         def __repr__(self):
             """docstring"""
@@ -501,20 +856,118 @@ class AhoTrie:
         return self.root.to_text()
 
     def add_word(self, word):
-        """docstring"""
-        # If the tree isn't dirty, it should be.  Wipe out the fail tree so it
-        # can be re-built from scratch later
-        if not self._dirty:
-            self._clear_fail_tree()
+        """Add a word, updating the failure tree in place if it's built.
+
+        Only the failure points and output links of the nodes the word affects
+        are recomputed, rather than the whole tree.
+        """
         node = self.root
+        new = []
         for char in word:
             # If the prefix already exists, don't bother creating it
             if node.contains(char):
                 node = node.search(char)
             else:
-                node = node.add_child(next(self.counter), char)
+                parent, node = node, node.add_child(next(self.counter), char)
+                new.append((parent, char, node))
         node.word = word
-        node.words = [word]
+        if self._dirty:
+            return
+        # Link the new nodes, and re-point any existing nodes that now have a
+        # longer suffix in the tree
+        changed = [node]
+        for parent, char, child in new:
+            nxt = parent.fail
+            while not nxt.contains(char):
+                nxt = nxt.fail
+            child.fail = nxt.search(char)
+            child.fail.add_fail_child(child)
+            changed.append(child)
+            # Existing nodes ending in this prefix are the children (by char)
+            # of nodes that fail, directly or not, to its parent.  Where one of
+            # those has no such child, the nodes failing to it might
+            stack = list(parent.fail_children)
+            while stack:
+                other = stack.pop()
+                if char not in other.children:
+                    stack.extend(other.fail_children)
+                    continue
+                other = other.children[char]
+                # If the existing failure point is longer, it's still right (and
+                # nodes still to be linked for this word have none yet)
+                if other.fail is not None and other.fail.depth < child.depth:
+                    other.fail.fail_children.discard(other)
+                    other.fail = child
+                    child.add_fail_child(other)
+                    changed.append(other)
+        self._refresh_outputs(changed)
+
+    def add_words(self, *words):
+        """Add several words, rebuilding the failure tree once for them all.
+
+        This is quicker than add_word for a large batch of words.
+        """
+        if not self._dirty:
+            self._clear_fail_tree()
+        for word in words:
+            self.add_word(word)
+
+    def remove_word(self, word):
+        """Remove a word, updating the nodes it affects in place.
+
+        Nodes at the end of the word that lead to no other word are pruned.
+        Nodes failing to a pruned node fail to its failure point instead (the
+        next longest suffix), and only the output links of the affected nodes
+        are recomputed, so adding and then removing a word restores the trie.
+        """
+        path = [self.root]
+        for char in word:
+            if not path[-1].contains(char):
+                return
+            path.append(path[-1].search(char))
+        node = path[-1]
+        if node.word != word:
+            return
+        node.word = ''
+        changed = []
+        while len(path) > 1 and not path[-1].word and not path[-1].children:
+            child = path.pop()
+            del path[-1].children[child.key]
+            if self._dirty:
+                continue
+            child.fail.fail_children.discard(child)
+            for other in child.fail_children:
+                other.fail = child.fail
+                child.fail.add_fail_child(other)
+                changed.append(other)
+        if not self._dirty:
+            if path[-1] is node:  # Unless it was pruned
+                changed.append(node)
+            self._refresh_outputs(changed)
+
+    def _refresh_outputs(self, nodes):
+        """Recompute the output links of nodes and of the nodes failing to them
+
+        Nodes failing to one without a word share its output link, so the
+        change only spreads through those.
+        """
+        from heapq import heapify, heappop, heappush
+        # Shallowest first, so every node's failure point is up to date before
+        # its own link is taken from it
+        heap = [(node.depth, node.state, node) for node in nodes]
+        heapify(heap)
+        starts = {node.state for node in nodes}
+        done = set()
+        while heap:
+            _, state, node = heappop(heap)
+            if state in done:
+                continue
+            done.add(state)
+            out = node.fail if node.fail.word else node.fail.out
+            if state in starts or (out is not node.out and not node.word):
+                for child in node.fail_children:
+                    heappush(heap, (child.depth, child.state, child))
+            node.out = out
 
     def _build_fail_tree(self):
         """docstring"""
@@ -531,10 +984,10 @@ class AhoTrie:
                 while not nxt.contains(char):
                     nxt = nxt.fail
                 child.fail = nxt.search(char)
-                # For output purposes, concatenate the word list of the child
-                # with that of it's failure point
-                if child.fail.words:
-                    child.words.extend(child.fail.words)
+                child.fail.add_fail_child(child)
+                # For output purposes, link to the failure point if it has a
+                # word, or else to wherever it links
+                child.out = child.fail if child.fail.word else child.fail.out
                 que.append(child)
         self._dirty = False
 
@@ -544,15 +997,15 @@ class AhoTrie:
         # Wipe out the failure tree using a breadth-first search
         que = deque()
         que.append(self.root)
+        self.root.fail_children = ()
         while que:
             node = que.popleft()
             for child in node.children.values():
-                # No need to check anything - just revert the fail point and word
-                # list to default
+                # No need to check anything - just revert the fail point and
+                # output link to default
                 child.fail = None
-                child.words = []
-                if child.word:
-                    child.words = [child.word]
+                child.fail_children = ()
+                child.out = None
                 que.append(child)
         self._dirty = True
 
@@ -560,8 +1013,12 @@ class AhoTrie:
         """docstring"""
         self.root.disp()
 
-    def search(self, space):
-        """docstring"""
+    def search(self, space, starts=False):
+        """Yield (word, position of its last character) for every match.
+
+        With starts set, yield (word, start, end) instead, where
+        space[start:end] is the match.
+        """
         # If the tree is dirty, we need to build the failure tree
         if self._dirty:
             self._build_fail_tree()
@@ -570,15 +1027,546 @@ class AhoTrie:
             while not node.contains(char):
                 node = node.fail
             node = node.search(char)
-            for word in node.words:
-                yield word, pos
-        # This could pretty easily be modified to include start point of the
-        # match - for efficiency, though, we'd grab the length of the word when
-        # adding it to the tree and store the length of the word with the word
-        # itself, so we don't need to find the length but once in ever.
+            # Follow the output links from here - a node's depth is the length
+            # of its word, so the start of the match comes for free
+            out = node if node.word else node.out
+            while out is not None:
+                if starts:
+                    yield out.word, pos + 1 - out.depth, pos + 1
+                else:
+                    yield out.word, pos
+                out = out.out
+
+    def compile(self):
+        """Return an AhoDFA of the trie, for faster searching."""
+        return AhoDFA(self)
+
+    def get_words(self):
+        """Return the words in the trie, shortest first."""
+        from collections import deque
+        out = []
+        que = deque([self.root])
+        while que:
+            node = que.popleft()
+            if node.word:
+                out.append(node.word)
+            que.extend(node.children.values())
+        return out
+
+    def matcher(self, binary=False, encoding='utf-8'):
+        """Return an AhoMatcher for searching a stream in chunks.
+
+        With binary set, the matcher takes bytes-like chunks: it searches a
+        compiled copy of the trie with every string word encoded, and yields
+        the encoded words and byte offsets.  That copy is built on every call,
+        so for many matchers, build it once with trie.encoded().compile() and
+        call its matcher().
+        """
+        if binary:
+            return AhoMatcher(self.encoded(encoding).compile())
+        return AhoMatcher(self)
+
+    def encoded(self, encoding='utf-8'):
+        """Return a new AhoTrie of the words, with the strings encoded.
+
+        Words that are bytes already are kept as they are.
+        """
+        return AhoTrie(*(word.encode(encoding) if isinstance(word, str)
+                         else word for word in self.get_words()))
+
+    def save(self, path):
+        """Write the automaton to path, for AhoTrie.load."""
+        AhoMap.write(self, path)
+
+    @staticmethod
+    def load(path):
+        """Return an AhoMap of an automaton written by save."""
+        return AhoMap(path)
+# 
+
+
+class AhoDFA:
+    """An AhoTrie compiled into flat tables, for searching.
+
+    States are numbered breadth-first from the root (state 0).  goto[state] maps
+    each character to the next state, with the failure transitions already
+    followed, so searching takes one lookup per character; characters missing
+    from the dict go back to the root.  The words output at each state are
+    out_words[out_start[state]:out_start[state + 1]], as indices into words,
+    and emits[state] is set if there are any.  lengths holds the length of
+    each word.
+    The compiled automaton doesn't change when words are added to the trie.
+    """
+    def __init__(self, trie):
+        from array import array
+        from collections import deque
+        if trie._dirty:  # pylint: disable=protected-access
+            trie._build_fail_tree()  # pylint: disable=protected-access
+        # 
+        # Number the states breadth-first, so every state's failure state is
+        # numbered (and filled in) before it
+        nodes = [trie.root]
+        ids = {id(trie.root): 0}
+        que = deque(nodes)
+        while que:
+            for child in que.popleft().children.values():
+                ids[id(child)] = len(nodes)
+                nodes.append(child)
+                que.append(child)
+            # 
+        # 
+        self.words = words = []
+        word_ids = {}
+        goto = []
+        outs = []
+        for state, node in enumerate(nodes):
+            children = {char: ids[id(child)]
+                        for char, child in node.children.items()}
+            if state:
+                fail = ids[id(node.fail)]
+                trans = dict(goto[fail])
+                trans.update(children)
+                out = [node.word] if node.word else []
+                out.extend(outs[fail])
+            else:
+                trans = children
+                out = []
+            # 
+            goto.append(trans)
+            outs.append(out)
+        # 
+        out_start = array('L', [0])
+        out_words = array('L')
+        lengths = array('L')
+        for node, out in zip(nodes, outs):
+            for word in out:
+                # Words are first output by their own nodes, as the failure
+                # states come first
+                if word not in word_ids:
+                    word_ids[word] = len(words)
+                    words.append(word)
+                    lengths.append(node.depth)
+                # 
+                out_words.append(word_ids[word])
+            # 
+            out_start.append(len(out_words))
+        # 
+        self.goto = goto
+        self.out_start = out_start
+        self.out_words = out_words
+        self.lengths = lengths
+        # Flag the states with outputs, so the rest are skipped with one lookup
+        self.emits = bytes(start != end
+                           for start, end in zip(out_start, out_start[1:]))
+
+    def __repr__(self):
+        return '<AhoDFA: {} states, {} words>'.format(len(self.goto),
+                                                      len(self.words))
+
+    def search(self, space, starts=False):
+        """Yield every match, as AhoTrie.search."""
+        goto, words, lengths = self.goto, self.words, self.lengths
+        out_start, out_words = self.out_start, self.out_words
+        emits = self.emits
+        state = 0
+        for pos, char in enumerate(space):
+            state = goto[state].get(char, 0)
+            if emits[state]:
+                for ind in out_words[out_start[state]:out_start[state + 1]]:
+                    if starts:
+                        yield words[ind], pos + 1 - lengths[ind], pos + 1
+                    else:
+                        yield words[ind], pos
+                    # 
+                # 
+            # 
+        # 
+
+    def matcher(self):
+        """Return an AhoMatcher for searching a stream in chunks."""
+        return AhoMatcher(self)
+
+
+class AhoMatcher:
+    """Stateful search of an AhoTrie or AhoDFA over a stream of chunks.
+
+    Each call to feed() continues from the automaton state the last one ended
+    in, so matches spanning chunk boundaries are found.  Matches are (word,
+    start, end), where start and end are global offsets: they count every item
+    fed since creation (or the last reset), and end is exclusive.
+    """
+    def __init__(self, automaton):
+        self.automaton = automaton
+        self.reset()
+
+    def __repr__(self):
+        return 'AhoMatcher({!r})'.format(self.automaton)
+
+    def reset(self):
+        """Go back to the root state and restart the offsets at 0."""
+        self.pos = 0
+        self.state = 0 if isinstance(self.automaton, AhoDFA) else None
+
+    def feed(self, chunk):
+        """Return the matches ending within chunk."""
+        if isinstance(self.automaton, AhoDFA):
+            return list(self._scan_dfa(chunk))
+        # 
+        return list(self._scan_trie(chunk))
+
+    def _scan_trie(self, space):
+        trie = self.automaton
+        if trie._dirty:  # pylint: disable=protected-access
+            trie._build_fail_tree()  # pylint: disable=protected-access
+        # 
+        node = self.state or trie.root
+        pos = self.pos
+        try:
+            for char in space:
+                pos += 1
+                while not node.contains(char):
+                    node = node.fail
+                # 
+                node = node.search(char)
+                out = node if node.word else node.out
+                while out is not None:
+                    yield out.word, pos - out.depth, pos
+                    out = out.out
+                # 
+            # 
+        finally:
+            self.state, self.pos = node, pos
+        # 
+
+    def _scan_dfa(self, space):
+        dfa = self.automaton
+        goto, words, lengths = dfa.goto, dfa.words, dfa.lengths
+        out_start, out_words, emits = dfa.out_start, dfa.out_words, dfa.emits
+        state, pos = self.state, self.pos
+        try:
+            for char in space:
+                pos += 1
+                state = goto[state].get(char, 0)
+                if emits[state]:
+                    for ind in out_words[out_start[state]:out_start[state + 1]]:
+                        yield words[ind], pos - lengths[ind], pos
+                    # 
+                # 
+            # 
+        finally:
+            self.state, self.pos = state, pos
+        # 
 # 
 
 
+class AhoMap:
+    """An AhoTrie automaton searched directly from a memory-mapped file.
+
+    Loading only maps the file, so it takes the same time however many words
+    there are, and processes mapping the same file share its pages.  The file
+    holds flat arrays, in native byte order:
+        keys, nexts: the trie's edges, in an open-addressing hash table keyed
+            on (state << 21 | character code) + 1, with 0 for an empty slot
+        fails: the failure state of each state
+        outs: each state's output link (the next state on its failure chain
+            with a word), with 0 (the root) for none
+        word_ids: the index of each state's word, plus 1, or 0 for none
+        lengths: the length of each word
+        offsets, blob: word i is blob[offsets[i]:offsets[i + 1]], encoded as
+            UTF-8 for a trie of strings
+    Searching follows the failure states, as AhoTrie.search does, and is
+    slower than AhoDFA.search, but the file stays as small as the trie.
+    """
+    MAGIC = b'AHO1'
+    # magic, byte order, whether the words are strings, then the number of
+    # states, hash table slots, words and bytes of words
+    HEADER = '<4sc?2xQQQQ'
+
+    def __init__(self, path):
+        from mmap import mmap, ACCESS_READ
+        from struct import calcsize, unpack_from
+        from sys import byteorder
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap(file.fileno(), 0, access=ACCESS_READ)
+        # 
+        magic, order, self.text, states, slots, count, size = unpack_from(
+            self.HEADER, self._map)
+        if magic != self.MAGIC:
+            raise ValueError('not a saved AhoTrie: {}'.format(path))
+        # 
+        if order != byteorder[0].encode():
+            raise ValueError('saved with {} byte order'.format(
+                'big' if order == b'b' else 'little'))
+        # 
+        view = memoryview(self._map)
+        pos = calcsize(self.HEADER)
+        arrays = []
+        for code, length in (('Q', slots), ('I', slots), ('I', states),
+                             ('I', states), ('I', states), ('I', count),
+                             ('Q', count + 1), ('B', size)):
+            end = pos + length * calcsize(code)
+            arrays.append(view[pos:end].cast(code))
+            pos = end + -end % 8  # Keep every array 8-byte aligned
+        # 
+        (self.keys, self.nexts, self.fails, self.outs, self.word_ids,
+         self.lengths, self.offsets, self.blob) = arrays
+        self._words = {}
+
+    def __repr__(self):
+        return 'AhoTrie.load({!r})'.format(self.path)
+
+    def __reduce__(self):
+        # Other processes map the file for themselves, sharing its pages
+        return AhoMap, (self.path,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the arrays and unmap the file."""
+        for name in ('keys', 'nexts', 'fails', 'outs', 'word_ids', 'lengths',
+                     'offsets', 'blob'):
+            getattr(self, name).release()
+        # 
+        self._map.close()
+
+    def word(self, ind):
+        """Return word number ind, decoding (and caching) it if need be."""
+        try:
+            return self._words[ind]
+        except KeyError:
+            word = bytes(self.blob[self.offsets[ind]:self.offsets[ind + 1]])
+            self._words[ind] = word = word.decode() if self.text else word
+            return word
+        # 
+
+    def search(self, space, starts=False):
+        """Yield every match, as AhoTrie.search."""
+        keys, nexts, fails = self.keys, self.nexts, self.fails
+        outs, word_ids, lengths = self.outs, self.word_ids, self.lengths
+        word, text = self.word, self.text
+        if not lengths:  # Nothing to find (nor to tell strings from bytes)
+            return
+        # 
+        mask = len(keys) - 1
+        state = 0
+        for pos, char in enumerate(space):
+            code = ord(char) if text else char
+            while True:
+                key = (state << 21 | code) + 1
+                slot = (state * 2654435761 + code) & mask
+                found = keys[slot]
+                while found and found != key:
+                    slot = (slot + 1) & mask
+                    found = keys[slot]
+                # 
+                if found:
+                    state = nexts[slot]
+                    break
+                # 
+                if not state:
+                    break
+                # 
+                state = fails[state]
+            # 
+            out = state if word_ids[state] else outs[state]
+            while out:
+                ind = word_ids[out] - 1
+                if starts:
+                    yield word(ind), pos + 1 - lengths[ind], pos + 1
+                else:
+                    yield word(ind), pos
+                # 
+                out = outs[out]
+            # 
+        # 
+
+    @classmethod
+    def write(cls, trie, path):
+        """Write an AhoTrie of strings or bytes to path."""
+        from array import array
+        from collections import deque
+        from struct import calcsize, pack
+        from sys import byteorder
+        if trie._dirty:  # pylint: disable=protected-access
+            trie._build_fail_tree()  # pylint: disable=protected-access
+        # 
+        # Number the states breadth-first, as AhoDFA does
+        nodes = [trie.root]
+        ids = {id(trie.root): 0}
+        que = deque(nodes)
+        while que:
+            for child in que.popleft().children.values():
+                ids[id(child)] = len(nodes)
+                nodes.append(child)
+                que.append(child)
+            # 
+        # 
+        words = [node.word for node in nodes if node.word]
+        text = all(isinstance(word, str) for word in words)
+        if not text and not all(isinstance(word, bytes) for word in words):
+            raise TypeError('only tries of strings or of bytes can be saved')
+        # 
+        slots = 1
+        while slots < 2 * len(nodes):  # Keep the table at most half full
+            slots <<= 1
+        # 
+        keys = array('Q', bytes(8 * slots))
+        nexts = array('I', bytes(4 * slots))
+        fails = array('I', bytes(4 * len(nodes)))
+        outs = array('I', bytes(4 * len(nodes)))
+        word_ids = array('I', bytes(4 * len(nodes)))
+        lengths = array('I')
+        offsets = array('Q', [0])
+        blob = bytearray()
+        for state, node in enumerate(nodes):
+            for char, child in node.children.items():
+                code = ord(char) if text else char
+                slot = (state * 2654435761 + code) & (slots - 1)
+                while keys[slot]:
+                    slot = (slot + 1) & (slots - 1)
+                # 
+                keys[slot] = (state << 21 | code) + 1
+                nexts[slot] = ids[id(child)]
+            # 
+            if state:
+                fails[state] = ids[id(node.fail)]
+                outs[state] = ids[id(node.out)] if node.out is not None else 0
+            # 
+            if node.word:
+                lengths.append(node.depth)
+                blob += node.word.encode() if text else node.word
+                offsets.append(len(blob))
+                word_ids[state] = len(lengths)
+            # 
+        # 
+        with open(path, 'wb') as file:
+            file.write(pack(cls.HEADER, cls.MAGIC, byteorder[0].encode(), text,
+                            len(nodes), slots, len(lengths), len(blob)))
+            for arr in (keys, nexts, fails, outs, word_ids, lengths, offsets,
+                        blob):
+                file.write(arr)
+                file.write(bytes(-file.tell() % 8))
+            # 
+        # 
+
+
+# What a worker of aho_search_parallel searches, set by _aho_scan_init
+_AHO_SCAN = None
+
+
+def _aho_scan_init(dfa, space, path):
+    """Hand the automaton and what to search to a worker process."""
+    global _AHO_SCAN  # pylint: disable=global-statement
+    _AHO_SCAN = dfa, space, path
+
+
+def _aho_scan_segment(bounds, scan=None):
+    """Search space[start - overlap:end], returning the matches ending at or
+    after start, at global offsets.  scan is (dfa, space, path), by default
+    the worker's, as set by _aho_scan_init."""
+    dfa, space, path = scan or _AHO_SCAN
+    start, end, overlap = bounds
+    begin = max(start - overlap, 0)
+    if path is None:
+        chunk = space[begin:end]
+    else:
+        with open(path, 'rb') as file:
+            file.seek(begin)
+            chunk = file.read(end - begin)
+        # 
+    # 
+    # Any match ending before start lies within the overlap, and so was found
+    # by the previous segment already
+    return [(word, begin + first, begin + last)
+            for word, first, last in dfa.search(chunk, starts=True)
+            if begin + last > start]
+
+
+def aho_search_parallel(automaton, space=None, path=None, processes=None,
+                        segment=1 << 22, encoding='utf-8'):
+    """Yield (word, start, end) for every match, searching segments in parallel.
+
+    Search either space (a string or bytes-like object) or the file at path, in
+    segments of segment items.  Each segment is searched from max(word length)
+    - 1 items before it, so matches spanning segments are found, and only
+    matches ending within the segment itself are kept, so none is found twice.
+    Matches come back in the same order as from a single search.
+
+    automaton is an AhoTrie, which is compiled (with its string words encoded
+    with encoding if searching bytes or a file), or an AhoDFA or AhoMap, which
+    is used as is; its words must then be strings to search a string, or bytes
+    otherwise, or a TypeError is raised.  Each worker gets the automaton and
+    space once: by inheriting them where processes are forked, or else through
+    the pool initializer (an AhoMap is then mapped again by each worker,
+    sharing the file's pages).  Files are read by the workers, a segment at a
+    time.  With processes=1 the segments
+    are searched in this process, without a pool.  processes defaults to
+    os.cpu_count().
+    """
+    from os import fspath
+    from os.path import getsize
+    if (space is None) == (path is None):
+        raise ValueError('exactly one of space and path is required')
+    # 
+    if path is not None:
+        path = fspath(path)
+        length = getsize(path)
+    else:
+        length = len(space)
+    # 
+    text = path is None and isinstance(space, str)
+    if isinstance(automaton, AhoTrie):
+        if not text:
+            automaton = automaton.encoded(encoding)
+        # 
+        automaton = automaton.compile()
+    # 
+    # Check here rather than fail in a worker on the first character
+    if isinstance(automaton, AhoMap):
+        words_text = automaton.text if automaton.lengths else None
+    else:
+        words_text = (all(isinstance(word, str) for word in automaton.words)
+                      if automaton.words else None)
+    # 
+    if words_text is not None and words_text != text:
+        raise TypeError('cannot search {} for {}'.format(
+            'a string' if text else 'bytes',
+            'strings' if words_text else 'bytes'))
+    # 
+    overlap = max(automaton.lengths, default=1) - 1
+    bounds = [(start, min(start + segment, length), overlap)
+              for start in range(0, length, segment)]
+    if processes == 1:
+        scan = automaton, space, path
+        for start_end in bounds:
+            yield from _aho_scan_segment(start_end, scan)
+        # 
+        return
+    # 
+    from multiprocessing import get_start_method, Pool
+    _aho_scan_init(automaton, space, path)
+    if get_start_method() == 'fork':
+        # The workers inherit the automaton and space without copying them
+        pool = Pool(processes)
+    else:
+        pool = Pool(processes, _aho_scan_init, (automaton, space, path))
+    # 
+    try:
+        with pool:
+            for found in pool.imap(_aho_scan_segment, bounds):
+                yield from found
+            # 
+        # 
+    finally:
+        _aho_scan_init(None, None, None)  # Don't keep space alive here
+    # 
+
+
 def bitmap(num, ind=0):
     """docstring"""
     bits = []
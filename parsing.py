@@ -1,26 +1,800 @@
+"""Find duplicate keys in a comma-delimited file"""
 #one-line:
 #print('\n{}\n'.format('\n'.join(*(['Duplicate found!\n{}'.format(id) for (id, cnt) in __import__('collections').Counter(tuple(__import__('itertools').compress(line.strip().split(','), cols)) for cols, line in zip(__import__('itertools').repeat([[1 if i+1 in set(s) else 0 for i in range(max(s))] for s in [[int(i) for i in (input('Please input column numbers delimited by comma <1,2>:\n') or '1,2').split(',')]]][0]), open(input('Input file path:\n')))).most_common(num) if cnt > 1] for num in [input('\nShow all duplicates (Yes/<N>o)?\n')[:1].lower()!='y' or None])) or 'No duplicates found.'))
 
+from array import array
+from collections import defaultdict, namedtuple
 from itertools import compress
-seen = set()
-shown = set()
-showall = input('\nShow all duplicates (Yes/<N>o)?\n')[:1].lower()
-columns = input('Input column numbers, delimited by comma <1,2>:\n') or '1,2'
-columns = set(int(i) for i in columns.split(','))
-columns = [1 if i + 1 in columns else 0 for i in range(max(columns))]
-with open(input('Input file path:\n')) as file:
-    print()
-    for line in file:
+
+
+# line is the (1-based) line the duplicate was found on, first is the line the
+# key was first seen on, or None if the key storage mode can't tell
+Duplicate = namedtuple('Duplicate', 'key line first')
+# count is the number of times key was seen, locations is a list of
+# (path, line) pairs for every occurrence, in input order
+DuplicateGroup = namedtuple('DuplicateGroup', 'key count locations')
+# source and first are the path and line a key was first ingested from
+KnownDuplicate = namedtuple('KnownDuplicate', 'key line source first')
+
+
+def parse_columns(columns='1,2'):
+    """Turn comma-delimited, 1-based column numbers into a compress() mask"""
+    columns = set(int(i) for i in columns.split(','))
+    return [1 if i + 1 in columns else 0 for i in range(max(columns))]
+
+
+def iter_keys(file, columns):
+    """Yield (line number, key tuple) for each line of an open file"""
+    for lineno, line in enumerate(file, 1):
         params = line.strip().split(',')
-        id = tuple(compress(params, columns))
-        if id in seen and id not in shown:
-            print('Duplicate found!\n{}'.format(id))
-            shown.add(id)
-            if showall != 'y':
-                break
-        seen.add(id)
-    if not shown:
+        yield lineno, tuple(compress(params, columns))
+
+
+def _split_keys(lines, columns):
+    # Build the keys for a list of byte lines, splitting each only as far as
+    # the last requested column.  Slicing or itemgetter are much cheaper than
+    # compress(), which is only needed when a line is short of columns.
+    from operator import itemgetter
+    ncols = len(columns)
+    indexes = [i for i, col in enumerate(columns) if col]
+    if len(indexes) == ncols:
+        return [tuple(line.strip().split(b',', ncols)[:ncols])
+                for line in lines]
+    try:
+        if len(indexes) == 1:
+            ind = indexes[0]
+            return [(line.strip().split(b',', ncols)[ind],) for line in lines]
+        get = itemgetter(*indexes)
+        return [get(line.strip().split(b',', ncols)) for line in lines]
+    except IndexError:
+        return [tuple(compress(line.strip().split(b',', ncols), columns))
+                for line in lines]
+
+
+def iter_keys_mmap(path, columns, encoding='utf-8', chunk=1 << 20):
+    """Yield (line number, key tuple of bytes) for each line of a file
+
+    The file is memory-mapped and scanned in blocks of about chunk bytes
+    without being decoded; each line is split only as far as the last
+    requested column.  Lines containing a double quote are parsed with the
+    csv module instead (joining following lines while a field opened with a
+    quote is still open), and their key fields re-encoded.
+    """
+    from csv import reader
+    from itertools import count
+    from mmap import mmap, ACCESS_READ
+    with open(path, 'rb') as file:
+        try:
+            buf = mmap(file.fileno(), 0, access=ACCESS_READ)
+        except ValueError:  # Empty files can't be mapped
+            return
+        with buf:
+            size = len(buf)
+            pos = 0
+            lineno = 1
+            while pos < size:
+                # Cut the block at the last newline in the window, or the
+                # first one after it if a single line is longer than chunk
+                if pos + chunk >= size:
+                    end = size
+                else:
+                    end = (buf.rfind(b'\n', pos, pos + chunk) + 1
+                           or buf.find(b'\n', pos + chunk) + 1 or size)
+                block = buf[pos:end]
+                pos = end
+                lines = block.split(b'\n')
+                if block[-1:] == b'\n':
+                    lines.pop()
+                if b'"' not in block:
+                    yield from zip(count(lineno), _split_keys(lines, columns))
+                    lineno += len(lines)
+                    continue
+                ind = 0
+                while ind < len(lines):
+                    line = lines[ind]
+                    ind += 1
+                    start = lineno
+                    lineno += 1
+                    if b'"' not in line:
+                        yield start, _split_keys([line], columns)[0]
+                        continue
+                    while _in_quoted_field(line):
+                        if ind < len(lines):
+                            nxt = lines[ind]
+                            ind += 1
+                        elif pos < size:
+                            end = buf.find(b'\n', pos) + 1 or size
+                            nxt = buf[pos:end].rstrip(b'\n')
+                            pos = end
+                        else:
+                            break
+                        lineno += 1
+                        line += b'\n' + nxt
+                    params = next(reader([line.strip().decode(encoding)]), [])
+                    yield start, tuple(i.encode(encoding)
+                                       for i in compress(params, columns))
+
+
+def _in_quoted_field(line):
+    """Whether a line of bytes ends inside a quoted field, as csv reads it
+
+    Only a quote at the start of a field opens one; elsewhere in an unquoted
+    field a quote is just a character.
+    """
+    quoted = False
+    start = True  # At the start of a field
+    ind = 0
+    while ind < len(line):
+        char = line[ind:ind + 1]
+        if quoted:
+            if char == b'"':
+                if line[ind + 1:ind + 2] == b'"':  # An escaped quote
+                    ind += 1
+                else:
+                    quoted = False
+        elif char == b',':
+            start = True
+            ind += 1
+            continue
+        elif char == b'"' and start:
+            quoted = True
+        start = False
+        ind += 1
+    return quoted
+
+
+def read_keys(path, columns, binary=False):
+    """Yield (line number, key tuple) for each line of the file at path
+
+    If binary, the file is scanned as bytes with iter_keys_mmap and the key
+    fields are bytes.
+    """
+    if binary:
+        yield from iter_keys_mmap(path, columns)
+        return
+    with open(path) as file:
+        yield from iter_keys(file, columns)
+
+
+def text_key(key, encoding='utf-8'):
+    """Decode a key from iter_keys_mmap; str keys are returned as-is"""
+    return tuple(i.decode(encoding) if isinstance(i, bytes) else i
+                 for i in key)
+
+
+def key_digest(key, bits=64):
+    """Return a bits-wide integer digest of a key tuple of str or bytes
+
+    A str key and its UTF-8 encoded bytes form have the same digest.
+    """
+    from hashlib import blake2b
+    if key and isinstance(key[0], bytes):
+        data = b'\x1f'.join(key)
+    else:
+        data = '\x1f'.join(key).encode('utf-8', 'surrogatepass')
+    return int.from_bytes(blake2b(data, digest_size=bits // 8).digest(),
+                          'little')
+
+
+class DigestSet:
+    """Open-addressed set of 64 or 128-bit digests stored in a flat array
+
+    Each slot costs 8 (or 16) bytes, versus a tuple, its strings and a set
+    entry for every key in a plain set.  Zero marks an empty slot, so a digest
+    of zero is stored as one.
+    """
+    def __init__(self, bits=64, capacity=1024, load=0.6):
+        if bits not in (64, 128):
+            raise ValueError('bits must be 64 or 128')
+        self.bits = bits
+        self._words = bits // 64
+        self._load = load
+        self._len = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        size = 1 << max(int(capacity / self._load), 8).bit_length()
+        self._mask = size - 1
+        self._limit = int(size * self._load)
+        self._slots = array('Q', bytes(8 * self._words * size))
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, digest):
+        return self._find(digest or 1)[1]
+
+    def __iter__(self):
+        slots, words = self._slots, self._words
+        if words == 1:
+            yield from (i for i in slots if i)
+        else:
+            for ind in range(0, len(slots), 2):
+                if slots[ind] or slots[ind+1]:
+                    yield slots[ind] | slots[ind+1] << 64
+
+    @property
+    def nbytes(self):
+        """Bytes used by the slot array"""
+        return self._slots.itemsize * len(self._slots)
+
+    def _find(self, digest):
+        # Return (slot index, found) using linear probing
+        slots, mask = self._slots, self._mask
+        low = digest & 0xFFFFFFFFFFFFFFFF
+        ind = low & mask
+        if self._words == 1:
+            while True:
+                cur = slots[ind]
+                if not cur:
+                    return ind, False
+                if cur == digest:
+                    return ind, True
+                ind = (ind + 1) & mask
+        high = digest >> 64
+        while True:
+            cur_low, cur_high = slots[2*ind], slots[2*ind+1]
+            if not cur_low and not cur_high:
+                return ind, False
+            if cur_low == low and cur_high == high:
+                return ind, True
+            ind = (ind + 1) & mask
+
+    def add(self, digest):
+        """Add a digest, returning True if it was already present"""
+        digest = digest or 1
+        ind, found = self._find(digest)
+        if found:
+            return True
+        if self._words == 1:
+            self._slots[ind] = digest
+        else:
+            self._slots[2*ind] = digest & 0xFFFFFFFFFFFFFFFF
+            self._slots[2*ind+1] = digest >> 64
+        self._len += 1
+        if self._len > self._limit:
+            old = list(self)
+            self._alloc(2 * self._len)
+            self._len = 0
+            for i in old:
+                self.add(i)
+        return False
+
+
+class BloomFilter:
+    """Bloom filter over 128-bit digests, sized for an expected key count"""
+    def __init__(self, expected, error_rate=0.01):
+        from math import ceil, log
+        expected = max(int(expected), 1)
+        self.size = max(ceil(-expected * log(error_rate) / log(2) ** 2), 64)
+        self.hashes = max(round(self.size / expected * log(2)), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @property
+    def nbytes(self):
+        """Bytes used by the bit array"""
+        return len(self._bits)
+
+    def add(self, digest):
+        """Add a digest, returning True if it may already have been present"""
+        # Double hashing: derive every bit position from the two digest halves
+        bits, size = self._bits, self.size
+        first = digest & 0xFFFFFFFFFFFFFFFF
+        step = (digest >> 64) | 1
+        present = True
+        for i in range(self.hashes):
+            pos = (first + i * step) % size
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & bit:
+                present = False
+                bits[byte] |= bit
+        return present
+
+
+def estimate_lines(path, sample=1000):
+    """Estimate the number of lines in a file from the size of the first few"""
+    from itertools import islice
+    from os.path import getsize
+    with open(path, 'rb') as file:
+        lines = list(islice(file, sample))
+    if not lines:
+        return 0
+    if len(lines) < sample:
+        return len(lines)
+    return int(getsize(path) / (sum(len(i) for i in lines) / len(lines))) + 1
+
+
+def find_duplicates(path, columns, mode='exact', bits=64, expected=None,
+                    error_rate=0.01, binary=False):
+    """Yield a Duplicate for every line whose key was already seen in the file
+
+    :param path: path of the comma-delimited file
+    :param columns: compress() mask from parse_columns
+    :param mode: 'exact' keeps every key tuple in a set.  'digest' keeps only
+        fixed-size digests (see bits); a digest collision would be reported as
+        a duplicate, which is vanishingly unlikely with 128 bits.  'bloom'
+        makes a first pass through a Bloom filter, keeping 128-bit digests of
+        the keys it flags, then confirms them against the exact keys on a
+        second pass over the file, so its results are exact.
+    :param bits: digest size for 'digest' mode, 64 or 128
+    :param expected: expected number of distinct keys for 'bloom' mode.
+        Defaults to an estimate of the number of lines in the file
+    :param error_rate: Bloom filter false positive rate
+    :param binary: scan the file as bytes through mmap (see iter_keys_mmap),
+        which also parses quoted fields correctly.  Reported keys are still
+        decoded to str
+    """
+    if mode == 'exact':
+        seen = {}
+        for lineno, key in read_keys(path, columns, binary):
+            first = seen.setdefault(key, lineno)
+            if first != lineno:
+                yield Duplicate(text_key(key), lineno, first)
+    elif mode == 'digest':
+        seen = DigestSet(bits)
+        for lineno, key in read_keys(path, columns, binary):
+            if seen.add(key_digest(key, bits)):
+                yield Duplicate(text_key(key), lineno, None)
+    elif mode == 'bloom':
+        if expected is None:
+            expected = estimate_lines(path)
+        bloom = BloomFilter(expected, error_rate)
+        candidates = DigestSet(128)
+        for _, key in read_keys(path, columns, binary):
+            digest = key_digest(key, 128)
+            if bloom.add(digest):
+                candidates.add(digest)
+        del bloom
+        seen = {}
+        for lineno, key in read_keys(path, columns, binary):
+            if key_digest(key, 128) not in candidates:
+                continue
+            first = seen.setdefault(key, lineno)
+            if first != lineno:
+                yield Duplicate(text_key(key), lineno, first)
+    else:
+        raise ValueError('unknown mode: {}'.format(mode))
+
+
+def _bucket_path(directory, file_ind, bucket):
+    from os.path import join
+    return join(directory, 'f{}-b{}.part'.format(file_ind, bucket))
+
+
+def _partition_file(args):
+    # Spill each row of one input file to the bucket its key hashes to.  The
+    # digest is used rather than hash() because string hashes are salted per
+    # process, and every worker must agree on the bucket of a key.  Records
+    # are marshalled, as quoted fields read in binary may hold any character.
+    from marshal import dump
+    file_ind, path, columns, binary, buckets, directory = args
+    outs = [open(_bucket_path(directory, file_ind, i), 'wb')
+            for i in range(buckets)]
+    try:
+        for lineno, key in read_keys(path, columns, binary):
+            dump((lineno, key), outs[key_digest(key) % buckets])
+    finally:
+        for out in outs:
+            out.close()
+
+
+def _dedupe_bucket(args):
+    # Count every key in one bucket, across the parts spilled from each file
+    from marshal import load
+    bucket, nfiles, directory = args
+    locations = defaultdict(list)
+    for file_ind in range(nfiles):
+        with open(_bucket_path(directory, file_ind, bucket), 'rb') as file:
+            while True:
+                try:
+                    lineno, key = load(file)
+                except EOFError:
+                    break
+                locations[key].append((file_ind, lineno))
+    return [(text_key(key), locs) for key, locs in locations.items()
+            if len(locs) > 1]
+
+
+def find_duplicates_parallel(paths, columns, buckets=64, processes=None,
+                             directory=None, binary=False):
+    """Return a DuplicateGroup for every key seen more than once in any file
+
+    Rows are hash-partitioned by key into on-disk buckets (one worker per
+    input file), then each bucket is counted on its own worker, so memory
+    use is bounded by the largest bucket rather than the whole input.
+
+    :param paths: paths of the comma-delimited files
+    :param columns: compress() mask from parse_columns
+    :param buckets: number of partitions; raise it if a bucket won't fit in
+        memory
+    :param processes: size of the process pool.  Defaults to os.cpu_count()
+    :param directory: where to spill the buckets.  Defaults to a temporary
+        directory, which is removed afterwards
+    :param binary: read the files with iter_keys_mmap, as read_keys does
+    """
+    from multiprocessing import Pool
+    from tempfile import TemporaryDirectory
+    paths = list(paths)
+    with TemporaryDirectory(dir=directory) as tmp, Pool(processes) as pool:
+        pool.map(_partition_file,
+                 [(ind, path, columns, binary, buckets, tmp)
+                  for ind, path in enumerate(paths)],
+                 chunksize=1)
+        groups = []
+        for found in pool.imap_unordered(
+                _dedupe_bucket,
+                [(i, len(paths), tmp) for i in range(buckets)]):
+            groups.extend(found)
+    groups.sort(key=lambda group: group[1][0])
+    return [DuplicateGroup(key, len(locs),
+                           [(paths[ind], lineno) for ind, lineno in locs])
+            for key, locs in groups]
+
+
+class KeyIndex:
+    """Persistent index of key digests, for deduplicating across runs
+
+    Digests are kept in a SQLite table along with the file and line each key
+    was first ingested from, so new files can be checked against everything
+    seen before without re-reading it.  64-bit digests are stored as
+    integers, 128-bit ones as blobs.
+    """
+    def __init__(self, path, bits=64):
+        from sqlite3 import connect
+        if bits not in (64, 128):
+            raise ValueError('bits must be 64 or 128')
+        self.path = path
+        self.bits = bits
+        # Autocommit mode: transactions are managed explicitly in ingest
+        self.conn = connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value);
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY, path TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS keys (
+                digest PRIMARY KEY, source INTEGER NOT NULL,
+                line INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TEMP TABLE IF NOT EXISTS batch (digest PRIMARY KEY);
+        ''')
+        self.conn.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)',
+                          ('bits', bits))
+        stored = self.conn.execute(
+            "SELECT value FROM meta WHERE name = 'bits'").fetchone()[0]
+        if stored != bits:
+            self.conn.close()
+            raise ValueError('index was built with {}-bit digests'.format(
+                stored))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM keys').fetchone()[0]
+
+    def close(self):
+        """Close the database connection"""
+        self.conn.close()
+
+    def _encode(self, digest):
+        if self.bits == 128:
+            return digest.to_bytes(16, 'little')
+        # SQLite integers are signed
+        return digest - (1 << 64) if digest >= 1 << 63 else digest
+
+    def ingest(self, path, columns, binary=False, batch=10000, add=True):
+        """Yield a KnownDuplicate for every key in path seen before
+
+        Keys already in the index, or earlier in the same file, are reported;
+        the rest are added.  The file is read once, in batches of keys which
+        are looked up with a single join each.  Nothing is committed unless
+        the whole file is consumed and add is true, so an interrupted run
+        leaves the index untouched.
+        """
+        from itertools import islice
+        conn = self.conn
+        conn.execute('BEGIN')
+        done = False
+        try:
+            source = conn.execute('INSERT INTO sources (path) VALUES (?)',
+                                  (path,)).lastrowid
+            keys = read_keys(path, columns, binary)
+            rows = [(lineno, key, self._encode(key_digest(key, self.bits)))
+                    for lineno, key in islice(keys, batch)]
+            while rows:
+                conn.execute('DELETE FROM temp.batch')
+                conn.executemany('INSERT OR IGNORE INTO temp.batch VALUES (?)',
+                                 ((row[2],) for row in rows))
+                known = {digest: (src, line) for digest, src, line in
+                         conn.execute('''
+                             SELECT b.digest, s.path, k.line FROM temp.batch b
+                             JOIN keys k ON k.digest = b.digest
+                             JOIN sources s ON s.id = k.source''')}
+                new = []
+                for lineno, key, digest in rows:
+                    if digest in known:
+                        yield KnownDuplicate(text_key(key), lineno,
+                                             *known[digest])
+                    else:
+                        known[digest] = (path, lineno)
+                        new.append((digest, source, lineno))
+                conn.executemany('INSERT INTO keys VALUES (?, ?, ?)', new)
+                rows = [(lineno, key, self._encode(key_digest(key, self.bits)))
+                        for lineno, key in islice(keys, batch)]
+            done = True
+        finally:
+            conn.execute('COMMIT' if done and add else 'ROLLBACK')
+
+    def sources(self):
+        """Return the paths ingested so far, in order"""
+        return [path for path, in
+                self.conn.execute('SELECT path FROM sources ORDER BY id')]
+
+    def remove_source(self, path):
+        """Forget every key first ingested from path"""
+        conn = self.conn
+        conn.execute('BEGIN')
+        try:
+            conn.execute('''DELETE FROM keys WHERE source IN
+                            (SELECT id FROM sources WHERE path = ?)''', (path,))
+            conn.execute('DELETE FROM sources WHERE path = ?', (path,))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def compact(self):
+        """Drop sources with no keys left and rebuild the database file"""
+        self.conn.execute('''DELETE FROM sources WHERE id NOT IN
+                             (SELECT DISTINCT source FROM keys)''')
+        self.conn.execute('VACUUM')
+
+
+class HyperLogLog:
+    """HyperLogLog sketch estimating the number of distinct 64-bit digests
+
+    Uses 2**precision one-byte registers (4 KiB at the default of 12) for a
+    standard error of about 1.04 / sqrt(2**precision).  Sketches with the
+    same precision can be merged, and saved to bytes with to_bytes().
+    """
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError('precision must be between 4 and 18')
+        self.precision = precision
+        self._width = 64 - precision
+        self._mask = (1 << self._width) - 1
+        if registers is None:
+            registers = bytearray(1 << precision)
+        elif len(registers) != 1 << precision:
+            raise ValueError('register count does not match precision')
+        self.registers = bytearray(registers)
+
+    def __len__(self):
+        return round(self.estimate())
+
+    def add(self, digest):
+        """Add a 64-bit digest"""
+        # The top precision bits pick the register, which keeps the longest
+        # run of leading zeros (plus one) seen in the remaining bits
+        ind = digest >> self._width
+        rank = self._width - (digest & self._mask).bit_length() + 1
+        if rank > self.registers[ind]:
+            self.registers[ind] = rank
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError('cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        """Return the estimated number of distinct digests added"""
+        from math import log
+        count = len(self.registers)
+        if count == 16:
+            alpha = 0.673
+        elif count == 32:
+            alpha = 0.697
+        elif count == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / count)
+        raw = alpha * count * count / sum(2.0 ** -i for i in self.registers)
+        zeros = self.registers.count(0)
+        # Small-range correction: fall back to linear counting
+        if raw <= 2.5 * count and zeros:
+            return count * log(count / zeros)
+        return raw
+
+    def to_bytes(self):
+        """Return the sketch as bytes: the precision, then the registers"""
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a sketch from the output of to_bytes()"""
+        return cls(data[0], data[1:])
+
+
+def sketch_file(path, columns, precision=12, binary=False):
+    """Return a HyperLogLog sketch of the distinct keys in a file"""
+    sketch = HyperLogLog(precision)
+    add = sketch.add
+    for _, key in read_keys(path, columns, binary):
+        add(key_digest(key))
+    return sketch
+
+
+def _sketch_file(args):
+    return sketch_file(*args)
+
+
+def estimate_distinct(paths, columns, precision=12, binary=False,
+                      processes=None):
+    """Return the merged HyperLogLog sketch of the distinct keys in files
+
+    Each file is sketched in one pass on its own pool worker, and the
+    per-file sketches are merged.  Call estimate() on the result for the
+    approximate count.
+    """
+    from multiprocessing import Pool
+    paths = list(paths)
+    args = [(path, columns, precision, binary) for path in paths]
+    if len(paths) == 1:
+        return sketch_file(*args[0])
+    total = HyperLogLog(precision)
+    with Pool(processes) as pool:
+        for sketch in pool.imap_unordered(_sketch_file, args):
+            total.merge(sketch)
+    return total
+
+
+def expand_paths(paths):
+    """Split os.pathsep-delimited paths and expand any glob patterns"""
+    from glob import glob
+    from os import pathsep
+    return [path for pattern in paths.split(pathsep)
+            for path in (sorted(glob(pattern)) or [pattern])]
+
+
+def benchmark_key_extraction(path, columns, repeat=3):
+    """Return the best key extraction throughput, in GB/s, of each reader"""
+    from collections import deque
+    from os.path import getsize
+    from time import perf_counter
+    size = getsize(path)
+    out = {}
+    for name, binary in (('text', False), ('mmap', True)):
+        best = None
+        for _ in range(repeat):
+            start = perf_counter()
+            deque(read_keys(path, columns, binary), maxlen=0)
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        out[name] = size / best / 1e9 if best else float('inf')
+    return out
+
+
+def measure_key_memory(count=200000, width=2):
+    """Return the measured bytes per distinct key for each storage mode"""
+    from gc import collect
+    from tracemalloc import start, stop, get_traced_memory
+
+    def keys():
+        return (tuple('{:08x}-{}'.format(i, j) for j in range(width))
+                for i in range(count))
+
+    def measure(build):
+        collect()
+        start()
+        obj = build()
+        used = get_traced_memory()[0]
+        stop()
+        del obj
+        return used / count
+
+    def build_exact():
+        seen = {}
+        for lineno, key in enumerate(keys(), 1):
+            seen.setdefault(key, lineno)
+        return seen
+
+    def build_digests(bits):
+        def build():
+            seen = DigestSet(bits)
+            for key in keys():
+                seen.add(key_digest(key, bits))
+            return seen
+        return build
+
+    def build_bloom():
+        bloom = BloomFilter(count)
+        for key in keys():
+            bloom.add(key_digest(key, 128))
+        return bloom
+    return {'exact': measure(build_exact),
+            'digest64': measure(build_digests(64)),
+            'digest128': measure(build_digests(128)),
+            'bloom': measure(build_bloom)}
+
+
+def main():
+    showall = input('\nShow all duplicates (Yes/<N>o)?\n')[:1].lower()
+    columns = parse_columns(
+        input('Input column numbers, delimited by comma <1,2>:\n') or '1,2')
+    mode = input('Key storage (<E>xact/64/128/Bloom), or <C>ount distinct '
+                 'keys?\n').strip().lower()
+    count = mode[:1] == 'c'
+    if mode in ('64', '128'):
+        mode, bits = 'digest', int(mode)
+    else:
+        mode, bits = 'bloom' if mode[:1] == 'b' else 'exact', 64
+    binary = input('Scan file as raw UTF-8 bytes, parsing quoted fields '
+                   '(Yes/<N>o)?\n')[:1].lower() == 'y'
+    if count:
+        paths = expand_paths(input('Input file path(s):\n'))
+        sketch = estimate_distinct(paths, columns, binary=binary)
+        print('\nApproximately {:,.0f} distinct keys (+/- {:.1%}).\n'.format(
+            sketch.estimate(), 1.04 / len(sketch.registers) ** 0.5))
+        return
+    index = input('Key index file (blank for none):\n').strip()
+    paths = expand_paths(input('Input file path(s):\n'))
+    print()
+    if index:
+        # Every file is still ingested in full, so the index stays complete
+        groups = {}
+        with KeyIndex(index) as keys:
+            for path in paths:
+                for dup in keys.ingest(path, columns, binary):
+                    if dup.key not in groups:
+                        if groups and showall != 'y':
+                            continue
+                        groups[dup.key] = [(dup.source, dup.first)]
+                    groups[dup.key].append((path, dup.line))
+        for key, locations in groups.items():
+            print('Duplicate found!\n{}'.format(key))
+            for path, lineno in locations:
+                print('  {} line {}'.format(path, lineno))
+        if not groups:
+            print('No duplicates found.')
+        print()
+        return
+    if len(paths) > 1:
+        if mode != 'exact':
+            print('Several files are compared by exact key, spilling to disk; '
+                  'the key storage mode only applies to a single file.\n')
+        groups = find_duplicates_parallel(paths, columns, binary=binary)
+        for group in groups[:None if showall == 'y' else 1]:
+            print('Duplicate found {} times!\n{}'.format(group.count,
+                                                          group.key))
+            for path, lineno in group.locations:
+                print('  {} line {}'.format(path, lineno))
+        if not groups:
+            print('No duplicates found.')
+        print()
+        return
+    path = paths[0]
+    # Report each key once, with every line it's on, as the baseline did
+    groups = {}
+    for dup in find_duplicates(path, columns, mode, bits, binary=binary):
+        if dup.key not in groups:
+            groups[dup.key] = [dup.first] if dup.first is not None else []
+        groups[dup.key].append(dup.line)
+        if showall != 'y':
+            break
+    for key, lines in groups.items():
+        print('Duplicate found!\n{}'.format(key))
+        for lineno in lines:
+            print('  line {}'.format(lineno))
+    if not groups:
         print('No duplicates found.')
     print()
 
 
+if __name__ == '__main__':
+    main()
@@ -5,78 +5,98 @@ from heapq import heapreplace as heapreplace_min
 from heapq import _heapreplace_max as heapreplace_max
 
 
+SNAPSHOT_VERSION = 1
+
+
 def heappush_max(heap, item):
     heap.append(item)
     _siftdown_max(heap, 0, len(heap)-1)
 
 
-def main():
-    class Node:
-        def __init__(self, val):
-            self.val = val
-            self.enabled = True
-        def __lt__(self, other):
-            return self.val < other
-        def __gt__(self, other):
-            return self.val > other
-        def __le__(self, other):
-            return self.val <= other
-        def __ge__(self, other):
-            return self.val >= other
-        def __eq__(self, other):
-            return self.val == other
-        def __ne__(self, other):
-            return self.val != other
-    _min = None
-    _max = None
-    _sum = None
-    cnt = 0
-    inp_s = None
-    nums = {}
-    cnts = {}
-    cnt_heap = []  # max_heap
-    inps = []
-    bot = []  # max_heap
-    top = []  # min_heap
-    while inp_s != '':
+class Node:
+    def __init__(self, val, enabled=True):
+        self.val = val
+        self.enabled = enabled
+    def __lt__(self, other):
+        return self.val < other
+    def __gt__(self, other):
+        return self.val > other
+    def __le__(self, other):
+        return self.val <= other
+    def __ge__(self, other):
+        return self.val >= other
+    def __eq__(self, other):
+        return self.val == other
+    def __ne__(self, other):
+        return self.val != other
+
+
+class RunningStats:
+    """Running minimum, maximum, total, average, median and mode of a stream
+
+    The whole state can be captured with snapshot() and rebuilt with
+    from_snapshot().  Heaps are stored in heap order, so reloading costs time
+    proportional to the snapshot rather than to the number of samples seen.
+    If checkpoint_path is given, the state is written there automatically
+    every checkpoint_every samples and/or checkpoint_interval seconds.  With
+    history set, every sample seen is part of the snapshot, so each snapshot
+    (and checkpoint) costs time proportional to the whole stream.
+    """
+    def __init__(self, history=False, checkpoint_path=None,
+                 checkpoint_every=None, checkpoint_interval=None):
+        from time import monotonic
+        self.min = None
+        self.max = None
+        self.sum = None
+        self.cnt = 0
+        self.nums = {}  # value -> number of times seen
+        self.cnts = {}  # number of times seen -> set of values
+        self.cnt_heap = []  # max_heap
+        self.bot = []  # max_heap
+        self.top = []  # min_heap
+        self.inps = [] if history else None
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self._since_checkpoint = 0
+        self._last_checkpoint = monotonic()
+
+    @property
+    def median(self):
+        bot, top = self.bot, self.top
         if len(top) == 0 and len(bot) == 0:
-            median = None
-        elif len(top) < len(bot):
-            median = bot[0]
-        elif len(top) > len(bot):
-            median = top[0]
-        else:
-            median = (bot[0]+top[0]) / 2 if (bot[0]&1 + top[0]&1) & 1 else round((bot[0]+top[0]) / 2)
-        if len(cnts) == 0:
-            mode = None
-        else:
-            mode = ', '.join(str(i) for i in cnts[cnt_heap[0].val])
-        min_s = str(_min)
-        max_s = str(_max)
-        sum_s = str(_sum)
-        avg_s = str(round(_sum/cnt, 4) if cnt else None)
-        med_s = str(median)
-        mod_s = str(mode)
-        maxlen = max(len(min_s), len(max_s), len(sum_s), len(avg_s), len(med_s))
-        print('Current minimum : {:{ln}}   Current maximum : {:{ln}}'.format(min_s, max_s, ln=maxlen))
-        print('Current total   : {:{ln}}   Current average : {:{ln}}'.format(sum_s, avg_s, ln=maxlen))
-        print('Current median  : {:{ln}}   Current mode    : {:{ln}}'.format(med_s, mod_s, ln=maxlen))
-        inp_s = input('Next number to add : ').strip()
-        print('')
-        try:
-            inp = int(inp_s)
-        except ValueError:
-            continue
-        inps.append(inp)
-        cnt += 1
-        if _min is None or inp < _min:
-            _min = inp
-        if _max is None or inp > _max:
-            _max = inp
-        if _sum is None:
-            _sum = inp
+            return None
+        if len(top) < len(bot):
+            return bot[0]
+        if len(top) > len(bot):
+            return top[0]
+        return (bot[0]+top[0]) / 2 if (bot[0]&1 + top[0]&1) & 1 else round((bot[0]+top[0]) / 2)
+
+    @property
+    def mode(self):
+        if len(self.cnts) == 0:
+            return None
+        return ', '.join(str(i) for i in self.cnts[self.cnt_heap[0].val])
+
+    @property
+    def average(self):
+        return round(self.sum/self.cnt, 4) if self.cnt else None
+
+    def add(self, inp):
+        median = self.median
+        nums, cnts, cnt_heap = self.nums, self.cnts, self.cnt_heap
+        bot, top = self.bot, self.top
+        if self.inps is not None:
+            self.inps.append(inp)
+        self.cnt += 1
+        if self.min is None or inp < self.min:
+            self.min = inp
+        if self.max is None or inp > self.max:
+            self.max = inp
+        if self.sum is None:
+            self.sum = inp
         else:
-            _sum += inp
+            self.sum += inp
         if inp in nums:
             cnts[nums[inp]].remove(inp)
             if len(cnts[nums[inp]]) == 0:
@@ -109,31 +129,131 @@ def main():
                 heappush_max(bot, heapreplace_min(top, inp))
             else:
                 heappush_min(top, inp)
+        self._since_checkpoint += 1
+        self._maybe_checkpoint()
+
+    def snapshot(self):
+        """Return the state as a dictionary of plain lists and numbers"""
+        snap = {
+            'version': SNAPSHOT_VERSION,
+            'moments': [self.min, self.max, self.sum, self.cnt],
+            'bot': self.bot,
+            'top': self.top,
+            # Frequencies are stored flat as [value, count, value, count, ...];
+            # the count buckets are rebuilt from them on load
+            'nums': [i for item in self.nums.items() for i in item],
+            'cnt_heap': [[i.val, int(i.enabled)] for i in self.cnt_heap],
+        }
+        if self.inps is not None:
+            snap['inps'] = self.inps
+        return snap
+
+    @classmethod
+    def from_snapshot(cls, snap, **kwargs):
+        """Build a RunningStats object from the output of snapshot()"""
+        if snap.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('unsupported snapshot version: {}'.format(
+                snap.get('version')))
+        kwargs.setdefault('history', 'inps' in snap)
+        out = cls(**kwargs)
+        out.min, out.max, out.sum, out.cnt = snap['moments']
+        # The heaps were saved in heap order, so no heapify is needed
+        out.bot = list(snap['bot'])
+        out.top = list(snap['top'])
+        flat = snap['nums']
+        out.nums = dict(zip(flat[::2], flat[1::2]))
+        for val, cnt in out.nums.items():
+            if cnt in out.cnts:
+                out.cnts[cnt].add(val)
+            else:
+                out.cnts[cnt] = {val}
+        out.cnt_heap = [Node(val, bool(enabled))
+                        for val, enabled in snap['cnt_heap']]
+        if out.inps is not None:
+            out.inps = list(snap.get('inps', ()))
+        return out
+
+    def save(self, path):
+        """Atomically write a snapshot of the state to path"""
+        from json import dump
+        from os import replace
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'w') as file:
+            dump(self.snapshot(), file, separators=(',', ':'))
+        replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Build a RunningStats object from a file written by save()"""
+        from json import load
+        with open(path) as file:
+            return cls.from_snapshot(load(file), **kwargs)
+
+    def checkpoint(self):
+        """Write the state to checkpoint_path, if one was given"""
+        from time import monotonic
+        if self.checkpoint_path is None:
+            return
+        self.save(self.checkpoint_path)
+        self._since_checkpoint = 0
+        self._last_checkpoint = monotonic()
+
+    def _maybe_checkpoint(self):
+        from time import monotonic
+        if self.checkpoint_path is None:
+            return
+        if (self.checkpoint_every
+                and self._since_checkpoint >= self.checkpoint_every):
+            self.checkpoint()
+        elif (self.checkpoint_interval is not None and self._since_checkpoint
+              and monotonic()-self._last_checkpoint >= self.checkpoint_interval):
+            self.checkpoint()
+
+
+def main(checkpoint_path=None):
+    from os.path import exists
+    # The history makes each checkpoint cost the whole stream, so checkpoint
+    # on a timer, and once more on the way out
+    kwargs = {'history': True, 'checkpoint_path': checkpoint_path,
+              'checkpoint_interval': 10}
+    if checkpoint_path and exists(checkpoint_path):
+        stats = RunningStats.load(checkpoint_path, **kwargs)
     else:
-        if len(top) == 0 and len(bot) == 0:
-            median = None
-        elif len(top) < len(bot):
-            median = bot[0]
-        elif len(top) > len(bot):
-            median = top[0]
-        else:
-            median = (bot[0]+top[0]) / 2 if (bot[0]&1 + top[0]&1) & 1 else round((bot[0]+top[0]) / 2)
-        if len(cnts) == 0:
-            mode = None
-        else:
-            mode = ', '.join(str(i) for i in cnts[cnt_heap[0].val])
-        min_s = str(_min)
-        max_s = str(_max)
-        sum_s = str(_sum)
-        avg_s = str(round(_sum/cnt, 4) if cnt else None)
-        med_s = str(median)
-        mod_s = str(mode)
+        stats = RunningStats(**kwargs)
+    inp_s = None
+    while inp_s != '':
+        min_s = str(stats.min)
+        max_s = str(stats.max)
+        sum_s = str(stats.sum)
+        avg_s = str(stats.average)
+        med_s = str(stats.median)
+        mod_s = str(stats.mode)
+        maxlen = max(len(min_s), len(max_s), len(sum_s), len(avg_s), len(med_s))
+        print('Current minimum : {:{ln}}   Current maximum : {:{ln}}'.format(min_s, max_s, ln=maxlen))
+        print('Current total   : {:{ln}}   Current average : {:{ln}}'.format(sum_s, avg_s, ln=maxlen))
+        print('Current median  : {:{ln}}   Current mode    : {:{ln}}'.format(med_s, mod_s, ln=maxlen))
+        inp_s = input('Next number to add : ').strip()
+        print('')
+        try:
+            inp = int(inp_s)
+        except ValueError:
+            continue
+        stats.add(inp)
+    else:
+        stats.checkpoint()
+        min_s = str(stats.min)
+        max_s = str(stats.max)
+        sum_s = str(stats.sum)
+        avg_s = str(stats.average)
+        med_s = str(stats.median)
+        mod_s = str(stats.mode)
         maxlen = max(len(min_s), len(max_s), len(sum_s), len(avg_s), len(med_s))
-        print('Final numbers: {}'.format(inps))
+        print('Final numbers: {}'.format(stats.inps))
         print('Minimum : {:{ln}}   Maximum : {:{ln}}'.format(min_s, max_s, ln=maxlen))
         print('Total   : {:{ln}}   Average : {:{ln}}'.format(sum_s, avg_s, ln=maxlen))
         print('Median  : {:{ln}}   Mode    : {:{ln}}'.format(med_s, mod_s, ln=maxlen))
 
 
 if __name__ == '__main__':
-    main()
+    from sys import argv
+    main(argv[1] if len(argv) > 1 else None)
@@ -7,6 +7,126 @@ class OutType(str, Enum):
     """Output type enumerator"""
     STR = 'str'
     NUM = 'num'
+    STATS = 'stats'
+
+
+DEFAULT_UNITS = [(1.0, "sec"), (1e-3, "msec"), (1e-6, "usec"), (1e-9, "nsec")]
+
+
+def format_time(time, precision=3, units=None):
+    """Format a time in seconds in the largest unit it's at least one of"""
+    # Round first, so a time that rounds up to the next unit is shown in it
+    # (999.9999 usec -> 1.00 msec rather than 1.00e+03 usec)
+    time = float('{:.{prec}g}'.format(time, prec=precision))
+    for scale, unit in units or DEFAULT_UNITS:
+        if time >= scale:
+            break
+    # The alternate form keeps trailing zeros (12 usec -> 12.0 usec); only
+    # a bare trailing point needs dropping
+    time = '{:#.{prec}g}'.format(time / scale, prec=precision).rstrip('.')
+    return '{} {}'.format(time, unit)
+
+
+def _percentile(ordered, pct):
+    """Linearly interpolated percentile of sorted values"""
+    pos = (len(ordered) - 1) * pct / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def _t_critical(confidence, dof):
+    """Two-sided Student's t critical value (Cornish-Fisher approximation)"""
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    if dof <= 0:
+        return float('inf')
+    return (z + (z**3 + z) / (4 * dof)
+            + (5*z**5 + 16*z**3 + 3*z) / (96 * dof**2)
+            + (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / (384 * dof**3))
+
+
+class TimingStats:
+    """Distribution statistics of per-loop timings, in seconds
+
+    If reject_outliers is given, timings outside the Tukey fences (that many
+    interquartile ranges beyond the quartiles) are moved from timings to
+    rejected before the statistics are computed.  ci is the confidence
+    interval of the mean, from Student's t distribution.  memory, if given,
+    holds per-loop memory figures from AutoTimer.memory.
+    """
+    def __init__(self, timings, loops=1, reject_outliers=None,
+                 confidence=0.95, memory=None):
+        from statistics import fmean, median, stdev
+        self.loops = loops
+        self.memory = memory
+        self.raw = list(timings)
+        self.rejected = []
+        self.timings = list(self.raw)
+        if reject_outliers is not None and len(self.raw) >= 4:
+            ordered = sorted(self.raw)
+            q1, q3 = _percentile(ordered, 25), _percentile(ordered, 75)
+            low = q1 - reject_outliers * (q3 - q1)
+            high = q3 + reject_outliers * (q3 - q1)
+            self.timings = [i for i in self.raw if low <= i <= high]
+            self.rejected = [i for i in self.raw if not low <= i <= high]
+        ordered = sorted(self.timings)
+        self.count = len(ordered)
+        self.min = ordered[0]
+        self.max = ordered[-1]
+        self.mean = fmean(ordered)
+        self.median = median(ordered)
+        self.stdev = stdev(ordered) if self.count > 1 else 0.0
+        self.q1 = _percentile(ordered, 25)
+        self.q3 = _percentile(ordered, 75)
+        self.iqr = self.q3 - self.q1
+        self.p95 = _percentile(ordered, 95)
+        self.p99 = _percentile(ordered, 99)
+        self.confidence = confidence
+        margin = (_t_critical(confidence, self.count - 1)
+                  * self.stdev / self.count ** 0.5) if self.count > 1 else 0.0
+        self.ci = (self.mean - margin, self.mean + margin)
+
+    def __repr__(self):
+        return 'TimingStats({!r}, loops={!r})'.format(self.raw, self.loops)
+
+    def __str__(self):
+        return self.format()
+
+    def format(self, precision=3, units=None):
+        """Summarise the statistics on one line"""
+        from statistics import median
+        def fmt(time):
+            return format_time(time, precision, units)
+        return ('{} loop{}, {} run{}{}: mean {} +/- {} ({:.0%} CI), '
+                'median {}, stdev {}, IQR {}, p95 {}, p99 {}').format(
+                    self.loops, 's' if self.loops != 1 else '',
+                    self.count, 's' if self.count != 1 else '',
+                    ' ({} outlier{} rejected)'.format(
+                        len(self.rejected),
+                        's' if len(self.rejected) != 1 else '')
+                    if self.rejected else '',
+                    fmt(self.mean), fmt(self.ci[1] - self.mean),
+                    self.confidence, fmt(self.median), fmt(self.stdev),
+                    fmt(self.iqr), fmt(self.p95), fmt(self.p99)) + (
+                        '' if self.memory is None else
+                        ', peak {} bytes, {:.4g} blocks, {:.4g} GC runs per '
+                        'loop'.format(max(self.memory['peak']),
+                                      median(self.memory['blocks']),
+                                      median(self.memory['gc'])))
+
+    def to_dict(self):
+        """Return the statistics as a JSON-serialisable dictionary"""
+        out = {name: getattr(self, name)
+               for name in ('loops', 'count', 'min', 'max', 'mean', 'median',
+                            'stdev', 'q1', 'q3', 'iqr', 'p95', 'p99',
+                            'confidence')}
+        out['ci'] = list(self.ci)
+        out['timings'] = self.timings
+        out['rejected'] = self.rejected
+        if self.memory is not None:
+            out['memory'] = self.memory
+        return out
 
 
 class AutoTimerProperties(type):
@@ -26,32 +146,33 @@ class AutoTimerProperties(type):
 
 class AutoTimer(Timer, metaclass=AutoTimerProperties):
     """Auto-ranging Timer object"""
-    _units = [(1.0, "sec"), (1e-3, "msec"), (1e-6, "usec"), (1e-9, "nsec")]
+    _units = list(DEFAULT_UNITS)
     
     def auto(self,
              repeat=default_repeat,
              callback=None,
              precision=3,
-             outptype=OutType.STR):
-        """Auto-range and time"""
-        def format_time(time):
-            from math import log10
-            for scale, unit in self.units:
-                if time >= scale:
-                    break
-            len_ = precision
-            time = time / scale
-            if int(log10(time))+1 < precision:
-                len_ = precision + 1
-            return '{:0<{len}.{prec}g} {}'.format(time,
-                                                  unit,
-                                                  prec=precision,
-                                                  len=len_)
+             outptype=OutType.STR,
+             reject_outliers=None,
+             confidence=0.95,
+             memory=False):
+        """Auto-range and time
+
+        OutType.STR returns a description of the best time per loop, and
+        OutType.NUM returns (loops, repeat, formatted best time).
+        OutType.STATS returns a TimingStats holding the per-loop timings and
+        their distribution; reject_outliers and confidence are passed to it.
+        If memory is set, the memory figures from self.memory are measured
+        after the timings and included in the TimingStats.
+        """
         num = self.autorange(callback)[0]
         raw_timings = self.repeat(repeat, num)
         timings = [i / num for i in raw_timings]
+        if outptype == OutType.STATS:
+            return TimingStats(timings, num, reject_outliers, confidence,
+                               self.memory(repeat, num) if memory else None)
         best = min(timings)
-        time = format_time(best)
+        time = format_time(best, precision, self.units)
         if outptype == OutType.STR:
             return ('{} loop{}, best of {}:'
                     ' {} per loop').format(num,
@@ -61,6 +182,49 @@ class AutoTimer(Timer, metaclass=AutoTimerProperties):
         if outptype == OutType.NUM:
             return num, repeat, time
     
+    def memory(self, repeat=default_repeat, number=1):
+        """Measure memory use per loop, in separate untimed runs
+
+        Returns a dictionary of per-repeat lists: 'peak' is the peak traced
+        memory in bytes while running one loop under tracemalloc, 'blocks' is
+        the net change in allocated memory blocks per loop, and 'gc' is the
+        number of garbage collections per loop.  The latter two run number
+        loops without tracemalloc and with GC enabled, as it would be
+        outside of timeit.
+        """
+        import gc
+        import tracemalloc
+        from itertools import repeat as loops
+        from sys import getallocatedblocks
+        out = {'peak': [], 'blocks': [], 'gc': []}
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            for _ in range(repeat):
+                tracemalloc.reset_peak()
+                start = tracemalloc.get_traced_memory()[0]
+                self.inner(loops(None, 1), self.timer)
+                out['peak'].append(tracemalloc.get_traced_memory()[1] - start)
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        gcold = gc.isenabled()
+        gc.enable()
+        try:
+            for _ in range(repeat):
+                collections = sum(i['collections'] for i in gc.get_stats())
+                blocks = getallocatedblocks()
+                self.inner(loops(None, number), self.timer)
+                out['blocks'].append((getallocatedblocks() - blocks) / number)
+                out['gc'].append((sum(i['collections']
+                                      for i in gc.get_stats())
+                                  - collections) / number)
+        finally:
+            if not gcold:
+                gc.disable()
+        return out
+    
     @property
     def units(self):
         return self._units
@@ -73,3 +237,404 @@ class AutoTimer(Timer, metaclass=AutoTimerProperties):
             if not isinstance(scale, Number) or not str(unit):
                 raise TypeError('incompatible units list')
         self._units = [(scale, str(unit)) for scale, unit in new_units]
+
+
+def permutation_pvalue(base, curr, alternative='greater', rounds=20000,
+                       seed=0):
+    """Permutation test p-value for a difference in mean timings
+
+    alternative is 'greater' (curr is slower than base), 'less' (curr is
+    faster) or 'two-sided'.  Every relabelling of the pooled timings is tried
+    when there are at most rounds of them, otherwise rounds random ones are.
+    """
+    from itertools import combinations
+    from math import comb
+    from random import Random
+    pooled = list(base) + list(curr)
+    count = len(curr)
+    total = sum(pooled)
+    def diff(sample_sum):
+        return (sample_sum / count
+                - (total - sample_sum) / (len(pooled) - count))
+    sign = {'greater': 1, 'less': -1, 'two-sided': 0}[alternative]
+    def score(sample_sum):
+        return abs(diff(sample_sum)) if not sign else sign * diff(sample_sum)
+    # Allow for float rounding in sums of the same values
+    observed = score(sum(curr))
+    observed -= abs(observed) * 1e-9
+    if comb(len(pooled), count) <= rounds:
+        hits = trials = 0
+        for combo in combinations(pooled, count):
+            trials += 1
+            hits += score(sum(combo)) >= observed
+        return hits / trials
+    rng = Random(seed)
+    hits = sum(score(sum(rng.sample(pooled, count))) >= observed
+               for _ in range(rounds))
+    return (hits + 1) / (rounds + 1)
+
+
+def _gc_setup(setup):
+    """Wrap a Timer setup so that garbage collection stays enabled"""
+    import gc
+    if callable(setup):
+        def enable_gc():
+            setup()
+            gc.enable()
+        return enable_gc
+    return 'import gc\ngc.enable()\n' + setup
+
+
+def _time_repeat(stmt, setup, number, warmup, disable_gc):
+    """Time one repeat of stmt, after warmup untimed repeats"""
+    timer = Timer(stmt, setup if disable_gc else _gc_setup(setup))
+    for _ in range(warmup):
+        timer.timeit(number)
+    return timer.timeit(number) / number
+
+
+def _time_repeat_task(args):
+    return _time_repeat(*args)
+
+
+class ABResult:
+    """Timings of several candidates from compare_ab
+
+    stats maps each name to a TimingStats.  The first candidate is the
+    baseline: speedup() is its median time over another's, and pvalue() the
+    two-sided permutation test p-value for a difference in mean times.
+    """
+    def __init__(self, stats):
+        self.stats = stats
+        self.baseline = next(iter(stats))
+
+    def speedup(self, name):
+        """How many times faster name is than the baseline"""
+        return self.stats[self.baseline].median / self.stats[name].median
+
+    def pvalue(self, name):
+        """Significance of the difference between name and the baseline"""
+        return permutation_pvalue(self.stats[self.baseline].timings,
+                                  self.stats[name].timings, 'two-sided')
+
+    def __str__(self):
+        width = max(len(str(name)) for name in self.stats)
+        lines = []
+        for name, stats in self.stats.items():
+            line = '{:<{}}  median {:>11}  mean {:>11} +/- {}'.format(
+                str(name), width, format_time(stats.median),
+                format_time(stats.mean), format_time(stats.ci[1] - stats.mean))
+            if name == self.baseline:
+                line += '  (baseline)'
+            else:
+                line += '  {:.3f}x  p={:.3f}'.format(self.speedup(name),
+                                                     self.pvalue(name))
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def compare_ab(candidates, setup='pass', repeat=default_repeat * 2,
+               warmup=1, disable_gc=True, isolate=False, processes=1,
+               reject_outliers=None):
+    """Time several statements or callables against each other
+
+    Repeats are interleaved round-robin, rotating the order every round, so
+    drift in CPU frequency, caches and GC state is spread evenly rather than
+    penalising whichever candidate runs second.  Each candidate's loop count
+    is autoranged first.
+
+    :param candidates: mapping of name -> statement (string or callable), or
+        a sequence of them (named by position).  The first is the baseline
+    :param setup: Timer setup for every candidate
+    :param repeat: timed repeats per candidate
+    :param warmup: untimed repeats before each timed one in a subprocess, or
+        before the first timed one otherwise
+    :param disable_gc: leave garbage collection off while timing, as timeit
+        does
+    :param isolate: time every repeat in a fresh worker process
+        (candidates and setup must then be strings or picklable)
+    :param processes: worker processes when isolate is set
+    :param reject_outliers: passed to TimingStats
+    """
+    if not hasattr(candidates, 'items'):
+        candidates = dict(enumerate(candidates))
+    names = list(candidates)
+    numbers = {name: AutoTimer(candidates[name], setup).autorange()[0]
+               for name in names}
+    order = [names[(rnd + ind) % len(names)]
+             for rnd in range(repeat) for ind in range(len(names))]
+    timings = {name: [] for name in names}
+    if isolate:
+        from multiprocessing import Pool
+        tasks = [(candidates[name], setup, numbers[name], warmup, disable_gc)
+                 for name in order]
+        with Pool(processes, maxtasksperchild=1) as pool:
+            results = pool.map(_time_repeat_task, tasks, chunksize=1)
+        for name, result in zip(order, results):
+            timings[name].append(result)
+    else:
+        timers = {name: Timer(candidates[name],
+                              setup if disable_gc else _gc_setup(setup))
+                  for name in names}
+        for name in names:
+            for _ in range(warmup):
+                timers[name].timeit(numbers[name])
+        for name in order:
+            timings[name].append(timers[name].timeit(numbers[name])
+                                 / numbers[name])
+    return ABResult({name: TimingStats(timings[name], numbers[name],
+                                       reject_outliers)
+                     for name in names})
+
+
+HISTOGRAM_BUCKETS = 64
+_RECORDERS = {}
+
+
+class CallTimer:
+    """Always-on call duration histogram
+
+    Durations are taken with perf_counter_ns and counted in power-of-two
+    buckets: bucket i holds durations of i bits, so [2**(i-1), 2**i)
+    nanoseconds.  Each thread records into its own shard, without locking,
+    and the shards are merged when read.  The shards of threads that have
+    finished are folded into one retired total whenever a shard is added or
+    the histogram is read, so thread churn doesn't grow them.  With sample
+    set to n > 1, only every nth call in each thread is timed.
+
+    Use an instance as a decorator or as a (reentrant) context manager.
+    Decorated generator functions are timed from the call until the
+    generator finishes or is closed, including time spent by the consumer.
+    """
+    def __init__(self, name=None, sample=1):
+        from threading import local, Lock
+        if sample < 1:
+            raise ValueError('sample must be at least 1')
+        self.name = name
+        self.sample = int(sample)
+        self._local = local()
+        self._lock = Lock()
+        self._shards = []  # (thread, shard) pairs
+        self._retired = [0] * (HISTOGRAM_BUCKETS + 1)
+
+    def __repr__(self):
+        return 'CallTimer({!r}, sample={!r})'.format(self.name, self.sample)
+
+    def __str__(self):
+        return self.format()
+
+    def _shard(self):
+        from threading import current_thread
+        # Buckets, then the total nanoseconds, then the sampling countdown
+        shard = [0] * HISTOGRAM_BUCKETS + [0, 1]
+        with self._lock:
+            self._retire()
+            self._shards.append((current_thread(), shard))
+        self._local.shard = shard
+        return shard
+
+    def _retire(self):
+        # Fold the shards of finished threads into the retired total; call
+        # with the lock held
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for ind, num in enumerate(shard[:HISTOGRAM_BUCKETS + 1]):
+                    self._retired[ind] += num
+        self._shards = live
+
+    def record(self, nsec):
+        """Count a duration in nanoseconds"""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        shard[min(nsec.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        shard[HISTOGRAM_BUCKETS] += nsec
+
+    def _sampled(self):
+        """Whether the current call in this thread should be timed"""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        shard[-1] -= 1
+        if shard[-1]:
+            return False
+        shard[-1] = self.sample
+        return True
+
+    def __call__(self, func):
+        from functools import wraps
+        from inspect import isgeneratorfunction
+        from time import perf_counter_ns
+        local, new_shard, sampled = self._local, self._shard, self._sampled
+        total = HISTOGRAM_BUCKETS
+        if isgeneratorfunction(func):
+            record = self.record
+            @wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                if not sampled():
+                    return (yield from func(*args, **kwargs))
+                start = perf_counter_ns()
+                try:
+                    return (yield from func(*args, **kwargs))
+                finally:
+                    record(perf_counter_ns() - start)
+            return gen_wrapper
+        # The recording is inlined, as a method call would double the
+        # overhead; durations under 2**63 ns always fit the buckets
+        if self.sample == 1:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    nsec = perf_counter_ns() - start
+                    try:
+                        shard = local.shard
+                    except AttributeError:
+                        shard = new_shard()
+                    shard[nsec.bit_length()] += 1
+                    shard[total] += nsec
+            return wrapper
+        @wraps(func)
+        def sampled_wrapper(*args, **kwargs):
+            if not sampled():
+                return func(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                nsec = perf_counter_ns() - start
+                shard = local.shard
+                shard[nsec.bit_length()] += 1
+                shard[total] += nsec
+        return sampled_wrapper
+
+    def __enter__(self):
+        from time import perf_counter_ns
+        try:
+            starts = self._local.starts
+        except AttributeError:
+            starts = self._local.starts = []
+        # None marks an unsampled entry, so that exits stay paired
+        starts.append(perf_counter_ns() if self._sampled() else None)
+        return self
+
+    def __exit__(self, *exc_info):
+        from time import perf_counter_ns
+        start = self._local.starts.pop()
+        if start is not None:
+            self.record(perf_counter_ns() - start)
+
+    def reset(self):
+        """Zero every shard
+
+        Calls recorded concurrently with a reset may be lost or kept.
+        """
+        with self._lock:
+            self._retire()
+            self._retired = [0] * (HISTOGRAM_BUCKETS + 1)
+            for _, shard in self._shards:
+                shard[:HISTOGRAM_BUCKETS + 1] = [0] * (HISTOGRAM_BUCKETS + 1)
+
+    def snapshot(self, reset=False):
+        """Merge the shards into a JSON-serialisable dictionary
+
+        'buckets' maps each non-empty bucket's exclusive upper bound in
+        nanoseconds to its count, and the percentiles are estimated from
+        the bucket midpoints.  Times are in seconds.
+        """
+        with self._lock:
+            self._retire()
+            shards = [self._retired[:]]
+            shards += [shard[:HISTOGRAM_BUCKETS + 1]
+                       for _, shard in self._shards]
+        if reset:
+            self.reset()
+        merged = [sum(i) for i in zip(*shards)]
+        counts = merged[:HISTOGRAM_BUCKETS]
+        count = sum(counts)
+        out = {'name': self.name, 'sample': self.sample, 'count': count,
+               'calls': count * self.sample,
+               'total': merged[HISTOGRAM_BUCKETS] * 1e-9 * self.sample,
+               'mean': merged[HISTOGRAM_BUCKETS] * 1e-9 / count
+                       if count else None,
+               'buckets': {1 << ind: num for ind, num in enumerate(counts)
+                           if num}}
+        for pct in (50, 90, 99, 99.9):
+            out['p{:g}'.format(pct)] = _bucket_percentile(counts, pct)
+        return out
+
+    def format(self, precision=3, units=None):
+        """Summarise the histogram on one line"""
+        snap = self.snapshot()
+        if not snap['count']:
+            return '{}: no calls'.format(self.name)
+        def fmt(time):
+            return format_time(time, precision, units)
+        return ('{}: {} call{}{}, mean {}, p50 {}, p90 {}, p99 {}, '
+                'p99.9 {}').format(
+                    self.name, snap['calls'],
+                    's' if snap['calls'] != 1 else '',
+                    ' (1 in {} timed)'.format(self.sample)
+                    if self.sample != 1 else '',
+                    fmt(snap['mean']), fmt(snap['p50']), fmt(snap['p90']),
+                    fmt(snap['p99']), fmt(snap['p99.9']))
+
+
+def _bucket_percentile(counts, pct):
+    """Estimated percentile in seconds of a power-of-two histogram"""
+    target = sum(counts) * pct / 100
+    seen = 0
+    for ind, num in enumerate(counts):
+        seen += num
+        if num and seen >= target:
+            # Midpoint of [2**(ind-1), 2**ind)
+            return (3 << ind) / 4 * 1e-9 if ind else 0.0
+    return None
+
+
+def timed(func=None, *, name=None, sample=1):
+    """Time calls into a named, shared CallTimer
+
+    Works as a bare decorator, as timed(name=..., sample=...) and, given a
+    name, as a context manager: "with timed(name='load'): ...".  The timer
+    is registered under name (the function's qualified name by default) for
+    snapshot() and export(); reusing a name reuses its timer.
+    """
+    if func is None:
+        if name is None:
+            return lambda func: timed(func, sample=sample)
+        return _recorder(name, sample)
+    return _recorder(name or '{}.{}'.format(func.__module__,
+                                             func.__qualname__),
+                     sample)(func)
+
+
+def _recorder(name, sample):
+    try:
+        return _RECORDERS[name]
+    except KeyError:
+        return _RECORDERS.setdefault(name, CallTimer(name, sample))
+
+
+def snapshot(reset=False):
+    """Snapshots of every timer registered through timed(), by name"""
+    return {name: timer.snapshot(reset)
+            for name, timer in list(_RECORDERS.items())}
+
+
+def export(file, reset=False):
+    """Write snapshot() as a line of JSON to a file object or path"""
+    from json import dumps
+    line = dumps(snapshot(reset), separators=(',', ':')) + '\n'
+    if hasattr(file, 'write'):
+        file.write(line)
+    else:
+        with open(file, 'a') as out:
+            out.write(line)